@@ -0,0 +1,217 @@
+"""
+Throughput benchmark for run_new_set.predict on synthetic VH-like sequences.
+
+How to run:
+
+uv run python benchmark.py --output bench.json
+uv run python benchmark.py --batch_sizes 8,32 --threads 1,4 --sizes 256,2048 --compare bench.json
+
+By default the model is a randomly initialised ESM classifier built locally from a small
+config (the shape of esm2_t6_8M), so nothing is downloaded and the numbers are comparable
+across machines and commits. Pass --model_path to benchmark a real adapter or merged
+checkpoint instead. Every combination of batch size, thread count and input size is scored
+once after a warm-up batch, and the results (sequences/s, p50/p99 batch latency, stage times
+and peak RSS) are printed and written to --output as JSON. Each case runs in a fresh
+process that loads its own model, so its peak RSS is not inflated by earlier cases.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+from transformers import EsmConfig, EsmForSequenceClassification, EsmTokenizer
+
+from run_new_set import AminoAcidTokenizer, load_model, new_timings, predict
+
+# Same 20 residues the submission form accepts
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+MAX_SEQUENCE_LENGTH = 130
+
+# Framework regions of common human VH germlines (IGHV1-2, IGHV3-23, IGHV4-34), CDRs are random
+FRAMEWORKS = [
+    ("QVQLVQSGAEVKKPGASVKVSCKAS", "MHWVRQAPGQGLEWMG", "RVTMTRDTSISTAYMELSRLRSDDTAVYYCAR", "WGQGTLVTVSS"),
+    ("EVQLLESGGGLVQPGGSLRLSCAAS", "MSWVRQAPGKGLEWVS", "RFTISRDNSKNTLYLQMNSLRAEDTAVYYCAK", "WGQGTLVTVSS"),
+    ("QVQLQQWGAGLLKPSETLSLTCAVY", "WSWIRQPPGKGLEWIG", "RVTISVDTSKNQFSLKLSSVTAADTAVYYCAR", "WGQGTMVTVSS"),
+]
+
+# ESM-2 vocabulary, in token id order
+ESM_VOCAB = ["<cls>", "<pad>", "<eos>", "<unk>", "L", "A", "G", "V", "S", "E", "R", "T", "I", "D", "P", "K",
+             "Q", "N", "F", "Y", "M", "H", "W", "C", "X", "B", "U", "Z", "O", ".", "-", "<null_1>", "<mask>"]
+
+
+def synthetic_sequences(n, seed=0):
+    """Return `n` VH-like sequences with a realistic CDR length spread, capped at 130 residues."""
+    rng = random.Random(seed)
+
+    def cdr(length):
+        return "".join(rng.choice(AMINO_ACIDS) for _ in range(length))
+
+    sequences = []
+    for _ in range(n):
+        fr1, fr2, fr3, fr4 = rng.choice(FRAMEWORKS)
+        # CDR3 length is the main source of VH length variation (median ~15, long right tail)
+        cdr3 = max(3, min(30, int(rng.gauss(15, 4))))
+        sequence = fr1 + cdr(rng.randint(7, 10)) + fr2 + cdr(rng.randint(7, 10)) + fr3 + cdr(cdr3) + fr4
+        sequences.append(sequence[:MAX_SEQUENCE_LENGTH])
+    return sequences
+
+
+def build_tiny_model(hidden_size=320, num_layers=6, num_heads=20, seed=0):
+    """Build a randomly initialised ESM classifier and its tokenizer without any downloads."""
+    with tempfile.TemporaryDirectory() as tmp:
+        vocab_file = os.path.join(tmp, "vocab.txt")
+        with open(vocab_file, "w") as f:
+            f.write("\n".join(ESM_VOCAB))
+        tokenizer = AminoAcidTokenizer(EsmTokenizer(vocab_file))
+    config = EsmConfig(vocab_size=len(ESM_VOCAB), hidden_size=hidden_size, num_hidden_layers=num_layers,
+                       num_attention_heads=num_heads, intermediate_size=4 * hidden_size,
+                       max_position_embeddings=1026, pad_token_id=1, mask_token_id=32,
+                       position_embedding_type="rotary", token_dropout=True, num_labels=2)
+    torch.manual_seed(seed)
+    model = EsmForSequenceClassification(config).eval()
+    return model, tokenizer
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run_case(model, tokenizer, sequences, batch_size, threads, precision="fp32"):
+    torch.set_num_threads(threads)
+    # Warm-up so one-off allocation and thread pool start-up are not counted
+    predict(model, tokenizer, sequences[:batch_size], batch_size=batch_size, precision=precision)
+
+    timings = new_timings()
+    start = time.perf_counter()
+    predict(model, tokenizer, sequences, batch_size=batch_size, precision=precision, timings=timings)
+    elapsed = time.perf_counter() - start
+    batches = timings["batches"]
+    return {
+        "batch_size": batch_size,
+        "threads": threads,
+        "sequences": len(sequences),
+        "seconds": round(elapsed, 4),
+        "sequences_per_second": round(len(sequences) / elapsed, 2),
+        "batch_p50_ms": round(percentile(batches, 50) * 1000, 3),
+        "batch_p99_ms": round(percentile(batches, 99) * 1000, 3),
+        "tokenize_seconds": round(timings["tokenize"], 4),
+        "forward_seconds": round(timings["forward"], 4),
+        "softmax_seconds": round(timings["softmax"], 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_isolated_case(args, size, batch_size, threads):
+    """Load the model and run one case in this (fresh) process; see run_case_in_child."""
+    if args.model_path:
+        model, tokenizer = load_model(args.model_path, precision=args.precision)
+    else:
+        model, tokenizer = build_tiny_model(args.hidden_size, args.num_layers, args.num_heads, args.seed)
+    # Same rng stream as the parent, so these are the first `size` of its sequences
+    return run_case(model, tokenizer, synthetic_sequences(size, args.seed), batch_size, threads, args.precision)
+
+
+def run_case_in_child(args, size, batch_size, threads):
+    """Run one case in a spawned child process.
+
+    ru_maxrss is the peak of the whole process, so measured in one process every case
+    would report the largest footprint of any case before it."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_isolated_case, args, size, batch_size, threads).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the throughput change of every case that is also present in the baseline file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["batch_size"], r["threads"], r["sequences"])
+    previous = {key(r): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for result in results:
+        old = previous.get(key(result))
+        if old:
+            change = result["sequences_per_second"] / old["sequences_per_second"] - 1
+            print(f"  batch {result['batch_size']:>4}, threads {result['threads']:>2}, "
+                  f"{result['sequences']:>6} seqs: {old['sequences_per_second']:>9.1f} -> "
+                  f"{result['sequences_per_second']:>9.1f} seq/s ({change:+.1%})")
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", default=None,
+                        help="Adapter or merged checkpoint to benchmark instead of the local tiny model")
+    parser.add_argument("--batch_sizes", type=int_list, default=[1, 8, 32], help="Comma-separated batch sizes")
+    parser.add_argument("--threads", type=int_list, default=[1, torch.get_num_threads()],
+                        help="Comma-separated torch thread counts")
+    parser.add_argument("--sizes", type=int_list, default=[256], help="Comma-separated numbers of sequences")
+    parser.add_argument("--precision", choices=("fp32", "bf16", "int8"), default="fp32")
+    parser.add_argument("--hidden_size", type=int, default=320, help="Hidden size of the tiny model")
+    parser.add_argument("--num_layers", type=int, default=6, help="Transformer layers of the tiny model")
+    parser.add_argument("--num_heads", type=int, default=20, help="Attention heads of the tiny model")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic sequences and weights")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Earlier --output file to compare throughput against")
+    args = parser.parse_args()
+
+    if not args.model_path and args.precision == "int8":
+        parser.error("--precision int8 needs --model_path")
+    sequences = synthetic_sequences(max(args.sizes), args.seed)
+    lengths = sorted(len(s) for s in sequences)
+    print(f"Synthetic sequences: {len(sequences)}, length min/median/max "
+          f"{lengths[0]}/{lengths[len(lengths) // 2]}/{lengths[-1]}")
+
+    results = []
+    for size, threads, batch_size in itertools.product(args.sizes, args.threads, args.batch_sizes):
+        result = run_case_in_child(args, size, batch_size, threads)
+        results.append(result)
+        print(f"batch {batch_size:>4}, threads {threads:>2}, {size:>6} seqs: "
+              f"{result['sequences_per_second']:>9.1f} seq/s, p50 {result['batch_p50_ms']:.1f} ms, "
+              f"p99 {result['batch_p99_ms']:.1f} ms, peak RSS {result['peak_rss_mb']:.0f} MiB")
+
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "model": args.model_path or f"tiny-esm h{args.hidden_size} l{args.num_layers} a{args.num_heads}",
+            "precision": args.precision,
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to: {args.output}")
+    if args.compare:
+        compare(results, args.compare)
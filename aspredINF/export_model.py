@@ -0,0 +1,110 @@
+"""
+Merge the LoRA adapter into the ESM base weights and export the result for CPU inference.
+
+How to run:
+
+uv run python export_model.py --model_path model_directory --output_dir merged_directory --onnx --torchscript
+
+The merged checkpoint can then be used with
+run_new_set.py --model_path merged_directory --backend {torch,onnx,torchscript}.
+If --check_csv is given, every exported backend is scored on that file and compared
+with the original LoRA model; the script exits with an error if prob_class1 differs
+by more than --tolerance.
+"""
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+import torch
+
+from run_new_set import ONNX_FILE, TORCHSCRIPT_FILE, compare_predictions, load_model, predict
+
+
+class LogitsOnly(torch.nn.Module):
+    """Expose (input_ids, attention_mask) -> logits so the model can be traced."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export(model, tokenizer, output_dir, onnx=False, torchscript=False):
+    """Merge the LoRA weights of `model` (in place) and save the merged checkpoint and exports."""
+    merged = model.merge_and_unload()
+    merged.eval()
+
+    os.makedirs(output_dir, exist_ok=True)
+    merged.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    print(f"Saved merged checkpoint to: {output_dir}")
+
+    wrapped = LogitsOnly(merged).eval()
+    example = tokenizer(["QVQLVQSGAEVKKPGASVKVSCKAS", "EVQLVESGG"], padding=True, return_tensors="pt")
+    example_inputs = (example["input_ids"], example["attention_mask"])
+
+    if torchscript:
+        with torch.no_grad():
+            traced = torch.jit.trace(wrapped, example_inputs)
+        traced = torch.jit.freeze(traced)
+        path = os.path.join(output_dir, TORCHSCRIPT_FILE)
+        traced.save(path)
+        print(f"Saved TorchScript model to: {path}")
+
+    if onnx:
+        path = os.path.join(output_dir, ONNX_FILE)
+        torch.onnx.export(
+            wrapped, example_inputs, path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "length"},
+                          "attention_mask": {0: "batch", 1: "length"},
+                          "logits": {0: "batch"}},
+        )
+        print(f"Saved ONNX model to: {path}")
+
+
+def check_parity(sequences, ref_probs, ref_preds, output_dir, backends, threshold=0.5, tolerance=1e-4):
+    """Score `sequences` with each exported backend and compare prob_class1 with the LoRA model."""
+    ok = True
+    for backend in backends:
+        exported, exported_tokenizer = load_model(output_dir, backend)
+        _, probs, preds = predict(exported, exported_tokenizer, sequences, threshold)
+        report = compare_predictions(ref_probs, ref_preds, probs, preds)
+        passed = report["max_abs_diff"] <= tolerance
+        ok = ok and passed
+        print(f"{backend}: max |dprob| = {report['max_abs_diff']:.2e}, "
+              f"label agreement = {report['label_agreement']:.1%} -> {'OK' if passed else 'FAILED'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", required=True, help="LoRA adapter directory")
+    parser.add_argument("--output_dir", required=True, help="Directory for the merged checkpoint")
+    parser.add_argument("--onnx", action="store_true", help=f"Also export {ONNX_FILE}")
+    parser.add_argument("--torchscript", action="store_true", help=f"Also export {TORCHSCRIPT_FILE}")
+    parser.add_argument("--check_csv", type=str, default=None,
+                        help="Optional CSV with a 'sequence' column used to verify the exported backends")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Threshold for positive class prediction")
+    parser.add_argument("--tolerance", type=float, default=1e-4,
+                        help="Maximum allowed absolute difference in prob_class1")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.model_path)
+    if args.check_csv:
+        # Reference scores must come from the LoRA model before it is merged
+        sequences = pd.read_csv(args.check_csv)["sequence"].tolist()
+        _, ref_probs, ref_preds = predict(model, tokenizer, sequences, args.threshold)
+
+    export(model, tokenizer, args.output_dir, onnx=args.onnx, torchscript=args.torchscript)
+
+    if args.check_csv:
+        backends = ["torch"] + (["onnx"] if args.onnx else []) + (["torchscript"] if args.torchscript else [])
+        if not check_parity(sequences, ref_probs, ref_preds, args.output_dir, backends,
+                            threshold=args.threshold, tolerance=args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,125 @@
+"""
+Pin a local, offline snapshot of the ESM base model and one or more LoRA adapters.
+
+How to run:
+
+uv run python prepare_model.py --model_path adapter_directory [adapter_directory ...] --output_dir snapshot_directory
+
+This is the only step that may download from the Hugging Face hub. The snapshot holds
+
+    snapshot.json                 manifest: base model name, adapter names, file checksums
+    base/                         config, tokenizer and weights as a single model.safetensors
+    adapters/<name>/              adapter_config.json and adapter_model.safetensors
+
+Pass the snapshot directory as --model_path to run_new_set.py or serve.py (and as
+--modelpath to the wrapper). The base weights are then memory-mapped from
+model.safetensors instead of being deserialized, so processes on the same machine share
+the pages. Nothing is fetched from the network. --verify re-checks an existing snapshot
+against the checksums in its manifest.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+
+import torch
+from safetensors.torch import save_file
+
+from run_new_set import SNAPSHOT_FILE, adapter_name
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def prepare(adapter_dirs, output_dir):
+    """Write base/, adapters/<name>/ and snapshot.json for `adapter_dirs` into `output_dir`."""
+    import peft
+    import transformers
+    from peft import PeftConfig
+    from transformers import EsmForSequenceClassification, EsmTokenizer
+
+    configs = [PeftConfig.from_pretrained(d) for d in adapter_dirs]
+    bases = {config.base_model_name_or_path for config in configs}
+    if len(bases) != 1:
+        raise ValueError(f"All adapters must be trained on the same base model, got {sorted(bases)}")
+    names = [adapter_name(d) for d in adapter_dirs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Adapter directory names must be unique, got {names}")
+    base = bases.pop()
+
+    base_dir = os.path.join(output_dir, "base")
+    print(f"Saving base model {base} to: {base_dir}")
+    model = EsmForSequenceClassification.from_pretrained(base)
+    # One unsharded safetensors file, so loading maps a single file
+    model.save_pretrained(base_dir, safe_serialization=True, max_shard_size="1000GB")
+    EsmTokenizer.from_pretrained(base).save_pretrained(base_dir)
+
+    for adapter_dir, name in zip(adapter_dirs, names):
+        target = os.path.join(output_dir, "adapters", name)
+        os.makedirs(target, exist_ok=True)
+        shutil.copy(os.path.join(adapter_dir, "adapter_config.json"), target)
+        weights = os.path.join(adapter_dir, "adapter_model.safetensors")
+        if os.path.exists(weights):
+            shutil.copy(weights, target)
+        else:
+            # Older adapters were saved as pickled torch files
+            state = torch.load(os.path.join(adapter_dir, "adapter_model.bin"), map_location="cpu", weights_only=True)
+            save_file({k: v.contiguous() for k, v in state.items()}, os.path.join(target, "adapter_model.safetensors"))
+        print(f"Saved adapter {name} to: {target}")
+
+    files = {}
+    for root, dirs, filenames in os.walk(output_dir):
+        dirs.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            if filename != SNAPSHOT_FILE:
+                files[os.path.relpath(path, output_dir)] = file_sha256(path)
+    manifest = {
+        "base_model": base,
+        "adapters": names,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "transformers": transformers.__version__,
+        "peft": peft.__version__,
+        "files": files,
+    }
+    with open(os.path.join(output_dir, SNAPSHOT_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Snapshot written to: {output_dir} ({len(names)} adapters, {len(files)} files)")
+
+
+def verify(snapshot_dir):
+    """Return the snapshot files that are missing or whose checksum does not match the manifest."""
+    with open(os.path.join(snapshot_dir, SNAPSHOT_FILE)) as f:
+        manifest = json.load(f)
+    bad = []
+    for relpath, checksum in manifest["files"].items():
+        path = os.path.join(snapshot_dir, relpath)
+        if not os.path.exists(path) or file_sha256(path) != checksum:
+            bad.append(relpath)
+    return bad
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", nargs="+", help="LoRA adapter directories sharing one base model")
+    parser.add_argument("--output_dir", help="Directory for the snapshot")
+    parser.add_argument("--verify", metavar="SNAPSHOT_DIR", default=None,
+                        help="Check an existing snapshot against its manifest instead of writing one")
+    args = parser.parse_args()
+
+    if args.verify:
+        bad = verify(args.verify)
+        print(f"{args.verify}: {'OK' if not bad else 'changed or missing: ' + ', '.join(bad)}")
+        sys.exit(1 if bad else 0)
+    if not args.model_path or not args.output_dir:
+        parser.error("--model_path and --output_dir are required")
+    prepare(args.model_path, args.output_dir)
@@ -1,43 +1,476 @@
 import argparse
+import json
+import multiprocessing
 import os
+import sys
+import time
+from collections import Counter
+import numpy as np
 import torch
 import pandas as pd
-from peft import PeftModel, PeftConfig
-from transformers import EsmTokenizer, EsmForSequenceClassification
 
+# transformers and peft take several seconds to import, so they are imported inside the
+# functions that need them (an onnx backend on a local checkpoint never imports them)
 
-def predict(model, tokenizer, sequences, threshold=0.5):
-    tokens = tokenizer(sequences, padding=True, truncation=True, max_length=512, return_tensors="pt")
-    with torch.no_grad():
-        outputs = model(**tokens)
-        logits = outputs.logits
-        probs = torch.softmax(logits, dim=1)
-        preds = (probs[:, 1] > threshold).int()
-    return logits.tolist(), probs[:, 1].tolist(), preds.tolist()
+MAX_LENGTH = 512
+BACKENDS = ("torch", "onnx", "torchscript")
+PRECISIONS = ("fp32", "bf16", "int8")
+# File names used for exported models inside a merged checkpoint directory
+ONNX_FILE = "model.onnx"
+TORCHSCRIPT_FILE = "model.pt"
+# Manifest of an offline snapshot written by prepare_model.py: base/ plus adapters/<name>/
+SNAPSHOT_FILE = "snapshot.json"
 
 
-def main(model_dir, csv_path, threshold=0.5, output_dir=None):
-    print(f"Input file: {csv_path}")
-    print(f"Model checkpoint: {model_dir}")
-    print(f"Classification threshold: {threshold}")
+class OnnxModel:
+    """Run an exported ONNX graph with ONNX Runtime, returning logits as a torch tensor."""
+
+    def __init__(self, path):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask):
+        (logits,) = self.session.run(["logits"], {"input_ids": input_ids.numpy(),
+                                                  "attention_mask": attention_mask.numpy()})
+        return torch.from_numpy(logits)
+
+
+class AminoAcidTokenizer:
+    """Vectorized drop-in for EsmTokenizer on plain residue strings.
+
+    Every single-character token of the wrapped tokenizer's vocabulary goes into a
+    256-entry byte lookup table, so a whole batch is encoded with a few NumPy operations
+    instead of per-character Python work. Batches containing anything else (lowercase,
+    whitespace, special tokens, non-ASCII) are handed to the wrapped tokenizer, which keeps
+    the ids identical to EsmTokenizer in every case. Other attributes (save_pretrained,
+    vocab, ...) are delegated to the wrapped tokenizer.
+
+    Given `vocab_dir` instead of a tokenizer, the table is read from its vocab.txt and
+    EsmTokenizer is only loaded if a batch or attribute actually needs it.
+    """
+
+    def __init__(self, tokenizer=None, vocab_dir=None):
+        self._tokenizer = tokenizer
+        self.vocab_dir = vocab_dir
+        if tokenizer is not None:
+            vocab = tokenizer.get_vocab()
+        else:
+            with open(os.path.join(vocab_dir, "vocab.txt")) as f:
+                vocab = {token: token_id for token_id, token in enumerate(f.read().splitlines())}
+        self.table = np.full(256, -1, dtype=np.int64)
+        for token, token_id in vocab.items():
+            if len(token) == 1 and token.isascii() and not token.isspace():
+                self.table[ord(token)] = token_id
+        self.cls_id = vocab["<cls>"]
+        self.eos_id = vocab["<eos>"]
+        self.pad_id = vocab["<pad>"]
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import EsmTokenizer
+            self._tokenizer = EsmTokenizer.from_pretrained(self.vocab_dir, local_files_only=True)
+        return self._tokenizer
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.tokenizer, name)
+
+    def encode_batch(self, sequences, max_length=None):
+        """Return padded (input_ids, attention_mask) tensors, or None if a sequence needs the slow path."""
+        try:
+            data = np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8)
+        except UnicodeEncodeError:
+            return None
+        ids = self.table[data]
+        if (ids < 0).any():
+            return None
+
+        lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+        # <cls> and <eos> take two of the max_length positions
+        kept = np.minimum(lengths, max_length - 2) if max_length else lengths
+        width = int(kept.max(initial=0)) + 2
+        rows = np.repeat(np.arange(len(sequences)), lengths)
+        # Position of every residue within its own sequence, shifted past <cls>
+        cols = np.arange(len(data)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + 1
+        keep = cols <= np.repeat(kept, lengths)
+
+        input_ids = np.full((len(sequences), width), self.pad_id, dtype=np.int64)
+        input_ids[:, 0] = self.cls_id
+        input_ids[rows[keep], cols[keep]] = ids[keep]
+        input_ids[np.arange(len(sequences)), kept + 1] = self.eos_id
+        attention_mask = (np.arange(width) < (kept + 2)[:, None]).astype(np.int64)
+        return torch.from_numpy(input_ids), torch.from_numpy(attention_mask)
+
+    def __call__(self, sequences, padding=False, truncation=False, max_length=None, return_tensors=None,
+                 **kwargs):
+        encoded = None
+        if (isinstance(sequences, list) and sequences and padding in (True, "longest")
+                and return_tensors == "pt" and not kwargs):
+            encoded = self.encode_batch(sequences, max_length if truncation else None)
+        if encoded is None:
+            return self.tokenizer(sequences, padding=padding, truncation=truncation, max_length=max_length,
+                                  return_tensors=return_tensors, **kwargs)
+        input_ids, attention_mask = encoded
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+def check_tokenizer(tokenizer, sequences, batch_size=32):
+    """Compare AminoAcidTokenizer with the wrapped EsmTokenizer on `sequences`; return the mismatches."""
+    mismatches = []
+    for start in range(0, len(sequences), batch_size):
+        batch = sequences[start:start + batch_size]
+        fast = tokenizer(batch, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+        slow = tokenizer.tokenizer(batch, padding=True, truncation=True, max_length=MAX_LENGTH,
+                                   return_tensors="pt")
+        for i, sequence in enumerate(batch):
+            if not (torch.equal(fast["input_ids"][i], slow["input_ids"][i]) and
+                    torch.equal(fast["attention_mask"][i], slow["attention_mask"][i])):
+                mismatches.append(sequence)
+    return mismatches
+
+
+def forward_logits(model, tokens):
+    """Run one forward pass and return logits for any of the supported backends."""
+    outputs = model(tokens["input_ids"], tokens["attention_mask"])
+    # Hugging Face models return a ModelOutput, exported graphs return the logits tensor
+    return outputs.logits if hasattr(outputs, "logits") else outputs
+
+
+def length_batches(sequences, batch_size=32, max_tokens=None):
+    """Yield lists of indices into `sequences`, grouped by similar length.
+
+    Sequences are sorted by length so each batch pads to a near-uniform width.
+    A batch is closed when it holds `batch_size` sequences or, if `max_tokens`
+    is set, when its padded size (rows x longest row) would exceed `max_tokens`.
+    """
+    order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+    batch = []
+    for i in order:
+        # Sorted ascending, so the newest sequence is the longest in the batch
+        width = min(len(sequences[i]), MAX_LENGTH - 2) + 2
+        if batch and (len(batch) >= batch_size or
+                      (max_tokens and (len(batch) + 1) * width > max_tokens)):
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+
+def new_timings():
+    """Accumulator for predict(): seconds per stage plus the latency of every batch."""
+    return {"tokenize": 0.0, "forward": 0.0, "softmax": 0.0, "batches": []}
+
+
+def predict(model, tokenizer, sequences, threshold=0.5, batch_size=32, max_tokens=None, precision="fp32",
+            timings=None):
+    logits = [None] * len(sequences)
+    probs = [None] * len(sequences)
+    preds = [None] * len(sequences)
+    with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=precision == "bf16"):
+        for batch in length_batches(sequences, batch_size, max_tokens):
+            t0 = time.perf_counter()
+            tokens = tokenizer([sequences[i] for i in batch], padding=True, truncation=True,
+                               max_length=MAX_LENGTH, return_tensors="pt")
+            t1 = time.perf_counter()
+            batch_logits = forward_logits(model, tokens).float()
+            t2 = time.perf_counter()
+            batch_probs = torch.softmax(batch_logits, dim=1)[:, 1]
+            batch_preds = (batch_probs > threshold).int()
+            # Scatter back so results line up with the input order
+            for i, l, p, y in zip(batch, batch_logits.tolist(), batch_probs.tolist(), batch_preds.tolist()):
+                logits[i], probs[i], preds[i] = l, p, y
+            t3 = time.perf_counter()
+            if timings is not None:
+                timings["tokenize"] += t1 - t0
+                timings["forward"] += t2 - t1
+                timings["softmax"] += t3 - t2
+                timings["batches"].append(t3 - t0)
+    return logits, probs, preds
+
+
+def predict_adapters(model, tokenizer, adapters, sequences, threshold=0.5, batch_size=32, max_tokens=None,
+                     precision="fp32", timings=None):
+    """Score `sequences` against every adapter loaded by load_adapters().
+
+    Each batch is tokenized once and then run through the shared base model with each
+    adapter switched in turn. Returns {adapter: (logits, probs, preds)} in input order.
+    """
+    results = {name: ([None] * len(sequences), [None] * len(sequences), [None] * len(sequences))
+               for name in adapters}
+    with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=precision == "bf16"):
+        for batch in length_batches(sequences, batch_size, max_tokens):
+            t0 = time.perf_counter()
+            tokens = tokenizer([sequences[i] for i in batch], padding=True, truncation=True,
+                               max_length=MAX_LENGTH, return_tensors="pt")
+            t1 = time.perf_counter()
+            forward = softmax = 0.0
+            for name in adapters:
+                t2 = time.perf_counter()
+                model.set_adapter(name)
+                batch_logits = forward_logits(model, tokens).float()
+                t3 = time.perf_counter()
+                batch_probs = torch.softmax(batch_logits, dim=1)[:, 1]
+                batch_preds = (batch_probs > threshold).int()
+                logits, probs, preds = results[name]
+                for i, l, p, y in zip(batch, batch_logits.tolist(), batch_probs.tolist(), batch_preds.tolist()):
+                    logits[i], probs[i], preds[i] = l, p, y
+                forward += t3 - t2
+                softmax += time.perf_counter() - t3
+            if timings is not None:
+                timings["tokenize"] += t1 - t0
+                timings["forward"] += forward
+                timings["softmax"] += softmax
+                timings["batches"].append(time.perf_counter() - t0)
+    return results
+
+
+# (model, tokenizer) inherited by forked worker processes, see start_workers()
+_worker_model = None
+
+
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+
+
+def _predict_shard(args):
+    sequences, kwargs = args
+    model, tokenizer = _worker_model
+    timings = new_timings()
+    return predict(model, tokenizer, sequences, timings=timings, **kwargs), timings
+
+
+def start_workers(model, tokenizer, workers, threads_per_worker=None):
+    """Start a pool of `workers` processes that each run predict() on their own shard.
+
+    The pool is forked after the model is loaded, so workers share the parent's weight
+    pages copy-on-write instead of loading N copies. Each worker gets its own slice of
+    the CPU threads so they do not oversubscribe the cores.
+    """
+    global _worker_model
+    _worker_model = (model, tokenizer)
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    print(f"Starting {workers} workers with {threads} torch threads each")
+    return multiprocessing.get_context("fork").Pool(workers, initializer=_init_worker, initargs=(threads,))
+
+
+def predict_sharded(pool, workers, sequences, threshold=0.5, timings=None, **kwargs):
+    """Run predict() across the worker pool and merge the results back in input order.
 
-    # Load tokenizer and model (LoRA-wrapped)
-    config = PeftConfig.from_pretrained(model_dir)
-    base_model = EsmForSequenceClassification.from_pretrained(config.base_model_name_or_path)
-    model = PeftModel.from_pretrained(base_model, model_dir)
-    tokenizer = EsmTokenizer.from_pretrained(config.base_model_name_or_path)
+    Stage timings from the workers are added to `timings`, so they are CPU-side seconds
+    summed over all workers rather than wall time.
+    """
+    # Deal length-sorted sequences round-robin so every shard gets a similar amount of work
+    order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+    shards = [order[w::workers] for w in range(workers)]
+    kwargs["threshold"] = threshold
+    results = pool.map(_predict_shard, [([sequences[i] for i in shard], kwargs) for shard in shards])
+
+    logits = [None] * len(sequences)
+    probs = [None] * len(sequences)
+    preds = [None] * len(sequences)
+    for shard, ((shard_logits, shard_probs, shard_preds), shard_timings) in zip(shards, results):
+        for i, l, p, y in zip(shard, shard_logits, shard_probs, shard_preds):
+            logits[i], probs[i], preds[i] = l, p, y
+        if timings is not None:
+            for stage in ("tokenize", "forward", "softmax"):
+                timings[stage] += shard_timings[stage]
+            timings["batches"].extend(shard_timings["batches"])
+    return logits, probs, preds
+
+
+def snapshot_root(adapter_dir):
+    """Return the prepare_model.py snapshot that `adapter_dir` belongs to, or None."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(adapter_dir)))
+    return root if os.path.exists(os.path.join(root, SNAPSHOT_FILE)) else None
+
+
+def expand_model_paths(model_dirs):
+    """Replace every snapshot directory in `model_dirs` by the adapter directories it holds."""
+    expanded = []
+    for model_dir in model_dirs:
+        manifest = os.path.join(model_dir, SNAPSHOT_FILE)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                adapters = json.load(f)["adapters"]
+            expanded.extend(os.path.join(model_dir, "adapters", name) for name in adapters)
+        else:
+            expanded.append(model_dir)
+    return expanded
+
+
+def _offline_if_snapshot(adapter_dirs):
+    """Keep the Hugging Face hub out of the picture when everything comes from a snapshot."""
+    if all(snapshot_root(d) for d in adapter_dirs):
+        # Read when huggingface_hub is first imported, which is why transformers/peft are imported late
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        if "huggingface_hub.constants" in sys.modules:
+            sys.modules["huggingface_hub.constants"].HF_HUB_OFFLINE = True
+
+
+def _base_model_path(adapter_dir, config):
+    """Base model for an adapter: the snapshot's local copy if there is one, else the configured name."""
+    root = snapshot_root(adapter_dir)
+    return os.path.join(root, "base") if root else config.base_model_name_or_path
+
+
+def _load_tokenizer(model_dir):
+    if os.path.exists(os.path.join(model_dir, "vocab.txt")):
+        return AminoAcidTokenizer(vocab_dir=model_dir)
+    from transformers import EsmTokenizer
+    return AminoAcidTokenizer(EsmTokenizer.from_pretrained(model_dir))
+
+
+def load_model(model_dir, backend="torch", precision="fp32"):
+    """Load the tokenizer and the ESM classifier for the given backend.
+
+    `model_dir` is either a LoRA adapter directory, a merged checkpoint written by
+    export_model.py, or a single-adapter snapshot written by prepare_model.py. The onnx and
+    torchscript backends need a merged checkpoint that contains the matching exported file.
+    Reduced precision is only supported with the torch backend: int8 merges the adapter
+    and dynamically quantizes the Linear layers, bf16 is applied as CPU autocast inside
+    predict().
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    if precision != "fp32" and backend != "torch":
+        raise ValueError(f"Precision {precision} is only supported with the torch backend.")
+
+    adapter_dirs = expand_model_paths([model_dir])
+    if len(adapter_dirs) > 1:
+        raise ValueError(f"{model_dir} holds {len(adapter_dirs)} adapters, load them with load_adapters().")
+    model_dir = adapter_dirs[0]
+
+    if os.path.exists(os.path.join(model_dir, "adapter_config.json")):
+        if backend != "torch":
+            raise ValueError(f"The {backend} backend needs a merged checkpoint, run export_model.py first.")
+        _offline_if_snapshot([model_dir])
+        from peft import PeftConfig, PeftModel
+        from transformers import EsmForSequenceClassification
+        base_path = _base_model_path(model_dir, PeftConfig.from_pretrained(model_dir))
+        base_model = EsmForSequenceClassification.from_pretrained(base_path)
+        model = PeftModel.from_pretrained(base_model, model_dir)
+        tokenizer = _load_tokenizer(base_path)
+    else:
+        tokenizer = _load_tokenizer(model_dir)
+        if backend == "onnx":
+            return OnnxModel(os.path.join(model_dir, ONNX_FILE)), tokenizer
+        elif backend == "torchscript":
+            model = torch.jit.load(os.path.join(model_dir, TORCHSCRIPT_FILE))
+        else:
+            from transformers import EsmForSequenceClassification
+            model = EsmForSequenceClassification.from_pretrained(model_dir)
     model.eval()
 
-    # Load input
-    df = pd.read_csv(csv_path)
-    if "sequence" not in df.columns:
-        raise ValueError("CSV file must contain a 'sequence' column.")
+    if precision == "int8":
+        if hasattr(model, "merge_and_unload"):
+            # Quantize the merged weights rather than the base and LoRA matrices separately
+            model = model.merge_and_unload()
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, tokenizer
+
+
+def adapter_name(adapter_dir):
+    """Name an adapter after its directory; used for the prob_<name> output columns."""
+    return os.path.basename(os.path.normpath(adapter_dir))
+
 
-    logits, probs, preds = predict(model, tokenizer, df["sequence"].tolist(), threshold)
+def load_adapters(adapter_dirs, precision="fp32"):
+    """Load several LoRA adapters on top of a single copy of their shared base model.
 
-    df["logits"] = logits
-    df["prob_class1"] = probs
-    df["predicted_label"] = preds
+    Only the adapter weights (and each adapter's classifier head) are loaded per adapter,
+    so memory and load time grow with the adapter size rather than the base model size.
+    Returns (model, tokenizer, names); switch adapters with model.set_adapter(name).
+    """
+    if precision not in ("fp32", "bf16"):
+        raise ValueError(f"Precision {precision} merges the adapter into the base weights, "
+                         "so it cannot be used with several adapters.")
+    adapter_dirs = expand_model_paths(adapter_dirs)
+    _offline_if_snapshot(adapter_dirs)
+    from peft import PeftConfig, PeftModel
+    from transformers import EsmForSequenceClassification
+
+    bases = {_base_model_path(d, PeftConfig.from_pretrained(d)) for d in adapter_dirs}
+    if len(bases) != 1:
+        raise ValueError(f"All adapters must be trained on the same base model, got {sorted(bases)}")
+    names = [adapter_name(d) for d in adapter_dirs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Adapter directory names must be unique, got {names}")
+
+    base = bases.pop()
+    model = PeftModel.from_pretrained(EsmForSequenceClassification.from_pretrained(base), adapter_dirs[0],
+                                      adapter_name=names[0])
+    for adapter_dir, name in zip(adapter_dirs[1:], names[1:]):
+        model.load_adapter(adapter_dir, adapter_name=name)
+    model.eval()
+    return model, _load_tokenizer(base), names
+
+
+def compare_predictions(ref_probs, ref_preds, probs, preds):
+    """Summarize how far `probs`/`preds` are from a reference run on the same sequences."""
+    diffs = [abs(a - b) for a, b in zip(ref_probs, probs)]
+    agree = sum(a == b for a, b in zip(ref_preds, preds))
+    return {
+        "max_abs_diff": max(diffs, default=0.0),
+        "mean_abs_diff": sum(diffs) / len(diffs) if diffs else 0.0,
+        "label_agreement": agree / len(preds) if preds else 1.0,
+    }
+
+
+def precision_report(model_dir, csv_path, threshold=0.5, batch_size=32, max_tokens=None, precisions=PRECISIONS):
+    """Score `csv_path` in each precision and compare prob_class1/predicted_label against fp32."""
+    sequences = pd.read_csv(csv_path)["sequence"].tolist()
+    print(f"Precision report on {csv_path} ({len(sequences)} sequences), reference: fp32")
+
+    results = {}
+    for precision in ("fp32",) + tuple(p for p in precisions if p != "fp32"):
+        model, tokenizer = load_model(model_dir, precision=precision)
+        start = time.perf_counter()
+        _, probs, preds = predict(model, tokenizer, sequences, threshold, batch_size=batch_size,
+                                  max_tokens=max_tokens, precision=precision)
+        elapsed = time.perf_counter() - start
+        del model
+        if precision == "fp32":
+            ref_probs, ref_preds = probs, preds
+        report = compare_predictions(ref_probs, ref_preds, probs, preds)
+        report["seqs_per_sec"] = len(sequences) / elapsed if elapsed else 0.0
+        results[precision] = report
+        print(f"{precision:>5}: max |dprob| = {report['max_abs_diff']:.2e}, "
+              f"mean |dprob| = {report['mean_abs_diff']:.2e}, "
+              f"label agreement = {report['label_agreement']:.1%}, "
+              f"{report['seqs_per_sec']:.1f} seq/s")
+    return results
+
+
+def main(model_dir, csv_path, threshold=0.5, output_dir=None, batch_size=32, max_tokens=None,
+         backend="torch", precision="fp32", chunksize=None, workers=1, threads_per_worker=None):
+    """Score `csv_path` and write the predictions CSV.
+
+    `model_dir` may also be a list of adapter directories sharing one base model; each
+    sequence is then scored against all of them and the output has logits_<name>,
+    prob_<name> and predicted_label_<name> columns per adapter.
+    """
+    model_dirs = expand_model_paths(model_dir if isinstance(model_dir, (list, tuple)) else [model_dir])
+    model_dir = model_dirs if len(model_dirs) > 1 else model_dirs[0]
+    print(f"Input file: {csv_path}")
+    print(f"Model checkpoint: {model_dir} ({backend} backend, {precision})")
+    print(f"Classification threshold: {threshold}")
+    print(f"Batch size: {batch_size}, max tokens per batch: {max_tokens or 'unlimited'}")
+
+    # Load tokenizer and model (LoRA-wrapped or merged), or one base model with several adapters
+    adapters = None
+    pool = None
+    if isinstance(model_dir, (list, tuple)):
+        if backend != "torch" or workers > 1:
+            raise ValueError("Several adapters are only supported with the torch backend and one worker.")
+        model, tokenizer, adapters = load_adapters(model_dir, precision)
+    else:
+        model, tokenizer = load_model(model_dir, backend, precision)
+        pool = start_workers(model, tokenizer, workers, threads_per_worker) if workers > 1 else None
 
     # Decide output file
     basename = os.path.basename(csv_path).replace(".csv", f"__thresh{threshold}_predictions.csv")
@@ -48,17 +481,101 @@ def main(model_dir, csv_path, threshold=0.5, output_dir=None):
     else:
         out_path = os.path.join(os.path.dirname(csv_path), basename)
 
-    df.to_csv(out_path, index=False)
+    # Load input, optionally streaming it in chunks so memory stays flat and each
+    # chunk's predictions are on disk as soon as they are computed
+    chunks = pd.read_csv(csv_path, chunksize=chunksize) if chunksize else [pd.read_csv(csv_path)]
+    label_counts = {name: Counter() for name in adapters or [None]}
+    timings = new_timings()
+    scored = 0
+    start = time.perf_counter()
+    try:
+        for i, df in enumerate(chunks):
+            if "sequence" not in df.columns:
+                raise ValueError("CSV file must contain a 'sequence' column.")
 
-    print(f"Predicted label counts: {pd.Series(preds).value_counts().to_dict()}")
+            if adapters:
+                results = predict_adapters(model, tokenizer, adapters, df["sequence"].tolist(), threshold,
+                                           batch_size=batch_size, max_tokens=max_tokens, precision=precision,
+                                           timings=timings)
+                for name, (logits, probs, preds) in results.items():
+                    df[f"logits_{name}"] = logits
+                    df[f"prob_{name}"] = probs
+                    df[f"predicted_label_{name}"] = preds
+                    label_counts[name].update(preds)
+            elif pool:
+                logits, probs, preds = predict_sharded(pool, workers, df["sequence"].tolist(), threshold,
+                                                       batch_size=batch_size, max_tokens=max_tokens,
+                                                       precision=precision, timings=timings)
+            else:
+                logits, probs, preds = predict(model, tokenizer, df["sequence"].tolist(), threshold,
+                                               batch_size=batch_size, max_tokens=max_tokens, precision=precision,
+                                               timings=timings)
+            if not adapters:
+                df["logits"] = logits
+                df["prob_class1"] = probs
+                df["predicted_label"] = preds
+                label_counts[None].update(preds)
+
+            df.to_csv(out_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+
+            scored += len(df)
+            if chunksize:
+                elapsed = time.perf_counter() - start
+                print(f"Scored {scored} sequences ({scored / elapsed:.1f} seq/s)", flush=True)
+    finally:
+        if pool:
+            # Every map() has returned or raised by now, so nothing is lost by terminating;
+            # on an error this also stops the other workers instead of leaking them
+            pool.terminate()
+            pool.join()
+
+    if timings["batches"]:
+        print(f"Stage timings: tokenize {timings['tokenize']:.2f}s, forward {timings['forward']:.2f}s, "
+              f"softmax {timings['softmax']:.2f}s over {len(timings['batches'])} batches")
+    for name, counts in label_counts.items():
+        print(f"Predicted label counts{f' ({name})' if name else ''}: {dict(counts.most_common())}")
     print(f"Saved predictions to: {out_path}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model_path", required=True)
+    parser.add_argument("--model_path", required=True, nargs="+",
+                        help="Model directory, or several LoRA adapters on the same base model to score at once")
     parser.add_argument("--input_csv", required=True)
     parser.add_argument("--threshold", type=float, default=0.5, help="Threshold for positive class prediction")
     parser.add_argument("--output_dir", type=str, required=False, default=None, help="Optional output directory")
+    parser.add_argument("--batch_size", type=int, default=32, help="Maximum number of sequences per forward pass")
+    parser.add_argument("--max_tokens", type=int, default=None,
+                        help="Optional cap on padded tokens (sequences x length) per forward pass")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Inference backend; onnx and torchscript need a checkpoint from export_model.py")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32",
+                        help="Numeric precision for the torch backend (bf16 autocast or dynamic int8)")
+    parser.add_argument("--precision_report", action="store_true",
+                        help="Compare all precisions against fp32 on --input_csv instead of writing predictions")
+    parser.add_argument("--check_tokenizer", action="store_true",
+                        help="Check that the vectorized tokenizer gives the same ids as EsmTokenizer on the input, then exit")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream the input CSV in chunks of this many rows, appending results as they finish")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes to shard each batch of sequences across")
+    parser.add_argument("--threads_per_worker", type=int, default=None,
+                        help="Torch threads per worker (default: CPU count divided by --workers)")
     args = parser.parse_args()
-    main(args.model_path, args.input_csv, threshold=args.threshold, output_dir=args.output_dir)
+    if args.precision_report:
+        precision_report(args.model_path[0], args.input_csv, threshold=args.threshold,
+                         batch_size=args.batch_size, max_tokens=args.max_tokens)
+    elif args.check_tokenizer:
+        _, tokenizer = load_model(args.model_path[0], args.backend)
+        sequences = pd.read_csv(args.input_csv)["sequence"].tolist()
+        mismatches = check_tokenizer(tokenizer, sequences, batch_size=args.batch_size)
+        print(f"Tokenizer check on {len(sequences)} sequences: {len(mismatches)} mismatches")
+        for sequence in mismatches[:10]:
+            print(f"  {sequence}")
+        if mismatches:
+            raise SystemExit(1)
+    else:
+        main(args.model_path, args.input_csv, threshold=args.threshold, output_dir=args.output_dir,
+             batch_size=args.batch_size, max_tokens=args.max_tokens, backend=args.backend,
+             precision=args.precision, chunksize=args.chunksize, workers=args.workers,
+             threads_per_worker=args.threads_per_worker)
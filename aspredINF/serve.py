@@ -0,0 +1,138 @@
+"""
+Long-running inference server that keeps the ASPred model loaded between runs.
+
+How to run:
+
+uv run python serve.py --model_path model_directory
+
+The server listens on 127.0.0.1:8765 by default and accepts:
+
+    GET  /health   -> {"status": "ok", "model_path": ..., "model_paths": [...], "precision": ...,
+                       "adapters": [...]}
+    POST /predict  <- {"sequences": [...], "threshold": 0.5}
+                   -> {"logits": [...], "prob_class1": [...], "predicted_label": [...],
+                       "timings": {"tokenize": s, "forward": s, "softmax": s, "batches": n}}
+
+Several --model_path adapters on the same base model can be served from one process. The
+top-level fields then hold the first adapter's results and the response also contains
+"adapters": {name: {"prob_class1": [...], "predicted_label": [...]}} for every adapter.
+model_paths lists the absolute model or adapter directories actually loaded (snapshots
+expanded), so clients can check the server is running the model they expect.
+"""
+
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from run_new_set import (BACKENDS, PRECISIONS, expand_model_paths, load_adapters, load_model, new_timings,
+                         predict, predict_adapters)
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    # Set on the class by serve() once the model is loaded
+    model = None
+    tokenizer = None
+    model_path = None
+    model_paths = None
+    batch_size = 32
+    max_tokens = None
+    precision = "fp32"
+    # Adapter names when several adapters share the base model, otherwise None
+    adapters = None
+    # The model is shared by all handler threads, so forward passes are serialized
+    lock = threading.Lock()
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {"status": "ok", "model_path": self.model_path, "model_paths": self.model_paths,
+                              "precision": self.precision, "adapters": self.adapters})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            sequences = request["sequences"]
+            threshold = float(request.get("threshold", 0.5))
+            if not isinstance(sequences, list) or not all(isinstance(s, str) for s in sequences):
+                raise ValueError("'sequences' must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"Invalid request: {e}"})
+            return
+
+        timings = new_timings()
+        kwargs = {"batch_size": self.batch_size, "max_tokens": self.max_tokens, "precision": self.precision,
+                  "timings": timings}
+        with self.lock:
+            if self.adapters:
+                results = predict_adapters(self.model, self.tokenizer, self.adapters, sequences, threshold, **kwargs)
+                logits, probs, preds = results[self.adapters[0]]
+            else:
+                logits, probs, preds = predict(self.model, self.tokenizer, sequences, threshold, **kwargs)
+        timings["batches"] = len(timings["batches"])
+        payload = {"logits": logits, "prob_class1": probs, "predicted_label": preds, "timings": timings}
+        if self.adapters:
+            payload["adapters"] = {name: {"prob_class1": adapter_probs, "predicted_label": adapter_preds}
+                                   for name, (_, adapter_probs, adapter_preds) in results.items()}
+        self._send_json(200, payload)
+
+
+def serve(model_dir, host="127.0.0.1", port=8765, batch_size=32, max_tokens=None, backend="torch",
+          precision="fp32"):
+    print(f"Model checkpoint: {model_dir} ({backend} backend, {precision})")
+    model_dirs = expand_model_paths(model_dir if isinstance(model_dir, (list, tuple)) else [model_dir])
+    if len(model_dirs) > 1:
+        if backend != "torch":
+            raise ValueError("Several adapters are only supported with the torch backend.")
+        model, tokenizer, InferenceHandler.adapters = load_adapters(model_dirs, precision)
+    else:
+        model, tokenizer = load_model(model_dirs[0], backend, precision)
+    InferenceHandler.model = model
+    InferenceHandler.tokenizer = tokenizer
+    InferenceHandler.model_path = model_dir
+    InferenceHandler.model_paths = [os.path.abspath(d) for d in model_dirs]
+    InferenceHandler.batch_size = batch_size
+    InferenceHandler.max_tokens = max_tokens
+    InferenceHandler.precision = precision
+
+    server = ThreadingHTTPServer((host, port), InferenceHandler)
+    print(f"Serving predictions on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", required=True, nargs="+",
+                        help="Model directory, or several LoRA adapters on the same base model")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--batch_size", type=int, default=32, help="Maximum number of sequences per forward pass")
+    parser.add_argument("--max_tokens", type=int, default=None,
+                        help="Optional cap on padded tokens (sequences x length) per forward pass")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Inference backend; onnx and torchscript need a checkpoint from export_model.py")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32",
+                        help="Numeric precision for the torch backend (bf16 autocast or dynamic int8)")
+    args = parser.parse_args()
+    serve(args.model_path, host=args.host, port=args.port,
+          batch_size=args.batch_size, max_tokens=args.max_tokens, backend=args.backend,
+          precision=args.precision)
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sequence_analyzer.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +87,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'aspred',
+    }
+}
+PAGE_CACHE_TIMEOUT = 600  # seconds, anonymous pages and static template fragments
+SUBMISSIONS_CACHE_TIMEOUT = 300  # seconds, per-user submissions pages (also versioned)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -134,10 +148,37 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGIN_URL = 'login'
 
+# Default number of submissions per user per day (UserProfile.daily_quota overrides it)
+SUBMISSION_DAILY_QUOTA = 1
+
+# JSON API
+API_MAX_BATCH_SIZE = 1000  # sequences accepted per POST to /api/submissions/
+API_EXPORT_CHUNK_SIZE = 2000  # rows fetched per database round trip when exporting
+
+# Submissions page (keyset pagination)
+SUBMISSIONS_PAGE_SIZE = 50
+SUBMISSIONS_MAX_PAGE_SIZE = 500
+
+# Live status updates for pending submissions (Server-Sent Events)
+SUBMISSION_STATUS_POLL_INTERVAL = 2  # seconds between checks of the still-pending rows
+SUBMISSION_STATUS_TIMEOUT = 300  # seconds before a stream ends and the browser reconnects
+
+# Prometheus metrics at /metrics/
+METRICS_TOKEN = None  # if set, scrapers must send 'Authorization: Bearer <token>' instead
+METRICS_ALLOWED_IPS = ['127.0.0.1']  # scrapers allowed to read the endpoint without METRICS_TOKEN
+METRICS_CLIENT_IP_HEADER = None  # META key holding the client address behind a proxy, e.g. 'HTTP_X_REAL_IP'
+METRICS_DIR = None  # directory shared by all worker processes for the latency histograms
+WRAPPER_TIMING_LOG = BASE_DIR / 'wrapper' / 'aspred_timings.jsonl'  # --timing_log of aspredwrapper.py
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@labsequenceanalyzer.com'
 
+# Email outbox (delivered by `python manage.py send_outbox`)
+OUTBOX_BATCH_SIZE = 100  # messages sent per SMTP connection
+OUTBOX_MAX_ATTEMPTS = 5  # give up and mark a message failed after this many tries
+OUTBOX_RETRY_BACKOFF = 60  # seconds before the first retry, doubled on each further failure
+
 # reCAPTCHA settings
 RECAPTCHA_PUBLIC_KEY = '6LeIxAcTAAAAAJcZVRqyHh71UMIEGNQ_MXjiZKhI'  # Test key
 RECAPTCHA_PRIVATE_KEY = '6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe'  # Test key
@@ -38,6 +38,20 @@ DATABASES = {
     }
 }
 
+# Cache shared by all Gunicorn workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
+}
+
+# Prometheus metrics: nginx's proxy_params sets X-Real-IP to the client address, and
+# every Gunicorn worker writes its latency histogram to METRICS_DIR
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+METRICS_CLIENT_IP_HEADER = 'HTTP_X_REAL_IP'
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+
 # Email Configuration
 #EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 #EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend' ##CHANGE
@@ -1,11 +1,58 @@
 from django.contrib import admin
-from .models import SequenceSubmission
+from .kmer_index import motif_search
+from .models import SequenceSubmission, PredictionCache, ApiToken, UserProfile, OutboundEmail
 
 # Register your models here.
 
 @admin.register(SequenceSubmission)
 class SequenceSubmissionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'sequence', 'status', 'submit_date', 'result', 'result_date')
-    list_filter = ('status', 'submit_date', 'result_date')
-    search_fields = ('user__username', 'sequence')
-    readonly_fields = ('submit_date',)
+    list_display = ('user', 'sequence', 'status', 'priority', 'worker_id', 'submit_date', 'queue_wait', 'result',
+                    'result_date')
+    list_filter = ('status', 'priority', 'submit_date', 'result_date')
+    search_fields = ('user__username',)
+    search_help_text = ("Username or sequence fragment; motifs with a run of at least 4 residues use the index "
+                        "('.' matches any residue)")
+    readonly_fields = ('submit_date', 'claim_date')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Sequence search goes through the k-mer index instead of a LIKE '%...%' table scan;
+        # terms the index cannot serve (shorter runs, other characters) still get the plain scan
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            matches = motif_search(search_term)
+            if matches is None:
+                matches = queryset.filter(sequence__icontains=search_term.strip())
+            results |= queryset.filter(pk__in=matches.values('pk'))
+        return results, may_have_duplicates
+
+    @admin.display(description='Queue wait')
+    def queue_wait(self, obj):
+        return obj.queue_wait
+
+
+@admin.register(PredictionCache)
+class PredictionCacheAdmin(admin.ModelAdmin):
+    list_display = ('sequence_hash', 'model_version', 'threshold', 'result', 'hits', 'created', 'last_hit')
+    list_filter = ('model_version',)
+    readonly_fields = ('created',)
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'name', 'key', 'created')
+    search_fields = ('user__username', 'name')
+    readonly_fields = ('key', 'created')
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'email_verified', 'daily_quota')
+    list_filter = ('email_verified',)
+    search_fields = ('user__username',)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('created', 'sent_at', 'last_error')
@@ -0,0 +1,169 @@
+import csv
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .kmer_index import index_submissions, similar_submissions
+from .models import ApiToken, SequenceSubmission, bump_submissions_version
+
+EXPORT_FIELDS = ('id', 'sequence', 'status', 'result', 'adapter_results', 'submit_date', 'result_date')
+
+
+def token_required(view):
+    """Authenticate the request from an 'Authorization: Token <key>' header."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'token' or not key:
+            return JsonResponse({'error': 'Missing API token'}, status=401)
+        token = ApiToken.objects.select_related('user__userprofile').filter(key=key.strip()).first()
+        if token is None or not token.user.is_active:
+            return JsonResponse({'error': 'Invalid API token'}, status=401)
+        request.user = token.user
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@csrf_exempt
+@require_POST
+@token_required
+def submit_sequences(request):
+    """Validate a batch of sequences in one pass and insert them with one bulk_create.
+
+    Body: {"sequences": ["QVQL...", ...]}. Nothing is inserted unless every sequence
+    is valid and the batch fits in the user's remaining daily quota."""
+    profile = request.user.userprofile
+    if not profile.email_verified:
+        return JsonResponse({'error': 'You must verify your email address before submitting sequences.'},
+                            status=403)
+    try:
+        sequences = json.loads(request.body)['sequences']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Body must be a JSON object with a "sequences" list'}, status=400)
+    if not isinstance(sequences, list) or not sequences:
+        return JsonResponse({'error': '"sequences" must be a non-empty list'}, status=400)
+    if len(sequences) > settings.API_MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'At most {settings.API_MAX_BATCH_SIZE} sequences per request'},
+                            status=400)
+
+    # Same rules as the submission form: the model field's validators
+    field = SequenceSubmission._meta.get_field('sequence')
+    errors = {}
+    for i, sequence in enumerate(sequences):
+        if not isinstance(sequence, str):
+            errors[i] = ['Sequence must be a string']
+            continue
+        try:
+            field.clean(sequence, None)
+        except ValidationError as e:
+            errors[i] = e.messages
+    if errors:
+        return JsonResponse({'error': 'Invalid sequences', 'details': errors}, status=400)
+
+    quota = profile.get_daily_quota()
+    used = profile.submissions_today()
+    if used + len(sequences) > quota:
+        return JsonResponse({'error': f'Daily quota exceeded: {used} of {quota} used today, '
+                                      f'{len(sequences)} requested'}, status=429)
+
+    started = timezone.now()
+    created = SequenceSubmission.objects.bulk_create(
+        [SequenceSubmission(user=request.user, sequence=sequence) for sequence in sequences]
+    )
+    # bulk_create does not send post_save
+    bump_submissions_version([request.user.id])
+    if all(s.pk for s in created):
+        index_submissions([(s.pk, s.sequence) for s in created])
+    else:
+        # Without returned keys, index this user's new rows (indexing twice is harmless)
+        index_submissions(SequenceSubmission.objects.filter(user=request.user, submit_date__gte=started)
+                          .values_list('id', 'sequence'))
+    return JsonResponse({
+        'created': len(created),
+        # Not every database backend returns primary keys from bulk inserts
+        'ids': [s.pk for s in created] if all(s.pk for s in created) else None,
+    }, status=201)
+
+
+@require_GET
+@token_required
+def similar_sequences(request):
+    """Return the user's prior submissions most similar to a sequence, with their results.
+
+    Query parameters: sequence (required), k (default 5, at most 50)."""
+    sequence = request.GET.get('sequence', '')
+    try:
+        SequenceSubmission._meta.get_field('sequence').clean(sequence, None)
+        k = max(1, min(int(request.GET.get('k', 5)), 50))
+    except ValidationError as e:
+        return JsonResponse({'error': 'Invalid sequence', 'details': e.messages}, status=400)
+    except ValueError:
+        return JsonResponse({'error': '"k" must be an integer'}, status=400)
+    matches = [
+        {'similarity': round(similarity, 4), **{field: getattr(submission, field) for field in EXPORT_FIELDS}}
+        for similarity, submission in similar_submissions(sequence, k, user=request.user)
+    ]
+    return JsonResponse({'matches': matches})
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output."""
+    def write(self, value):
+        return value
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+@require_GET
+@token_required
+def export_results(request):
+    """Stream the user's submissions as NDJSON (default) or CSV.
+
+    Optional query parameters: format=ndjson|csv, status=pending|done."""
+    rows = SequenceSubmission.objects.filter(user=request.user)
+    status = request.GET.get('status')
+    if status:
+        rows = rows.filter(status=status)
+    rows = _keyset_chunks(rows.values_list(*EXPORT_FIELDS), settings.API_EXPORT_CHUNK_SIZE)
+
+    if request.GET.get('format') == 'csv':
+        writer = csv.writer(_Echo())
+        content = (writer.writerow(_csv_row(row)) for row in _with_header(rows))
+        response = StreamingHttpResponse(content, content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="aspred_results.csv"'
+    else:
+        content = (json.dumps(dict(zip(EXPORT_FIELDS, row)), default=_json_default) + '\n' for row in rows)
+        response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+    return response
+
+
+def _keyset_chunks(rows, chunk_size):
+    """Yield `rows` (a values_list starting with 'id') in id order, one bounded query per chunk.
+
+    .iterator() only streams where the driver has server-side cursors; MySQL's reads the
+    whole result set into memory, so each chunk is its own id > last_id query instead."""
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def _csv_row(row):
+    # Per-adapter results go into a single JSON-encoded cell
+    return [json.dumps(value) if isinstance(value, dict) else value for value in row]
+
+
+def _with_header(rows):
+    yield EXPORT_FIELDS
+    yield from rows
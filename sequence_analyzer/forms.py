@@ -3,8 +3,6 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import SequenceSubmission
 from django.core.exceptions import ValidationError
-from datetime import datetime, timezone
-from django.utils.timezone import make_aware
 from captcha.fields import ReCaptchaField
 from captcha.widgets import ReCaptchaV2Checkbox
 
@@ -40,14 +38,10 @@ class SequenceSubmissionForm(forms.ModelForm):
             if not self.user.userprofile.email_verified:
                 raise ValidationError("You must verify your email address before submitting sequences.")
                 
-            # Check if user has already submitted today
-            today = make_aware(datetime.now())
-            today_submission = SequenceSubmission.objects.filter(
-                user=self.user,
-                submit_date__year=today.year,
-                submit_date__month=today.month,
-                submit_date__day=today.day
-            ).exists()
-            
-            if today_submission:
-                raise ValidationError("You have already submitted a sequence today. Please try again tomorrow.")
+            # Check the user's daily submission quota
+            quota = self.user.userprofile.get_daily_quota()
+            if self.user.userprofile.submissions_today() >= quota:
+                if quota == 1:
+                    raise ValidationError("You have already submitted a sequence today. Please try again tomorrow.")
+                raise ValidationError(
+                    f"You have reached your limit of {quota} submissions per day. Please try again tomorrow.")
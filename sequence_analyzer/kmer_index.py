@@ -0,0 +1,139 @@
+import hashlib
+import re
+import struct
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models.constants import OnConflict
+
+from .models import SequenceKmer, SequenceSketch, SequenceSubmission
+
+# Length of the k-mers stored per submission; motifs need a fixed run of at least this many residues
+KMER_SIZE = 4
+# MinHash signature of BANDS x ROWS values; two sequences become lookup candidates when all ROWS
+# values of any band agree, which happens mostly above ~(1 / BANDS) ** (1 / ROWS) = 0.77 k-mer Jaccard
+BANDS = 8
+ROWS = 8
+# Candidates scored exactly per lookup, taken in order of the number of shared bands
+MAX_CANDIDATES = 200
+
+# Fixed hash of the k-mer codes; the band buckets stored in the database depend on it
+_PRIME = (1 << 61) - 1
+_HASH_A, _HASH_B = 0x5DEECE66D1F3A7B, 0x2545F4914F6CDD1D
+_MOTIF = re.compile(r'^[A-Z.]+$')
+
+
+def kmers(sequence, k=KMER_SIZE):
+    """Return the distinct k-mers of `sequence` as integers (5 bits per residue)."""
+    codes = [ord(c) & 31 for c in sequence.upper()]
+    result = set()
+    for i in range(len(codes) - k + 1):
+        value = 0
+        for code in codes[i:i + k]:
+            value = value << 5 | code
+        result.add(value)
+    return result
+
+
+def band_buckets(kmer_set):
+    """Return the LSH bucket of each band of the MinHash signature of `kmer_set`.
+
+    The signature is a one-permutation MinHash: every k-mer is hashed once into one of
+    BANDS x ROWS bins and each bin keeps its minimum, so the cost is one hash per k-mer.
+    Empty bins borrow the value of the next non-empty bin (rotation densification)."""
+    size = BANDS * ROWS
+    bins = [None] * size
+    for x in kmer_set:
+        h = (_HASH_A * x + _HASH_B) % _PRIME
+        i, value = h % size, h // size
+        if bins[i] is None or value < bins[i]:
+            bins[i] = value
+    signature = []
+    for i in range(size):
+        distance = 0
+        while bins[(i + distance) % size] is None:
+            distance += 1
+        # Bin values are below 2 ** 56, so the borrow distance fits in the top bits
+        signature.append(bins[(i + distance) % size] | distance << 56)
+    return [
+        int.from_bytes(hashlib.blake2b(struct.pack(f'>{ROWS}Q', *signature[i:i + ROWS]), digest_size=8).digest(),
+                       'big', signed=True)
+        for i in range(0, len(signature), ROWS)
+    ]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def index_submissions(submissions):
+    """Add (id, sequence) pairs to the k-mer and MinHash indexes; already indexed pairs are skipped.
+
+    Rows are inserted with raw executemany, since building ~100 model instances per
+    sequence for bulk_create costs more than the inserts themselves."""
+    kmer_rows, sketch_rows = [], []
+    for submission_id, sequence in submissions:
+        kmer_set = kmers(sequence)
+        if not kmer_set:
+            continue
+        kmer_rows.extend((submission_id, kmer) for kmer in kmer_set)
+        sketch_rows.extend((submission_id, band, bucket) for band, bucket in enumerate(band_buckets(kmer_set)))
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    with connection.cursor() as cursor:
+        if kmer_rows:
+            cursor.executemany(f'{insert} {SequenceKmer._meta.db_table} (submission_id, kmer) VALUES (%s, %s)',
+                               kmer_rows)
+        if sketch_rows:
+            cursor.executemany(f'{insert} {SequenceSketch._meta.db_table} (submission_id, band, bucket) '
+                               f'VALUES (%s, %s, %s)', sketch_rows)
+    return len(sketch_rows) // BANDS
+
+
+def similar_submissions(sequence, k=5, user=None):
+    """Return up to `k` (similarity, submission) pairs for the prior submissions most similar to `sequence`.
+
+    Similarity is the Jaccard index of the k-mer sets. Only submissions sharing a MinHash
+    band with `sequence` are considered, so the lookup reads a few index entries instead
+    of the table; repeats of the same sequence are reported once, the latest submission."""
+    query = kmers(sequence)
+    if not query:
+        return []
+    bands = Q()
+    for band, bucket in enumerate(band_buckets(query)):
+        bands |= Q(band=band, bucket=bucket)
+    candidates = SequenceSketch.objects.filter(bands)
+    if user is not None:
+        # A subquery rather than a join, so the (band, bucket) index still drives the lookup
+        candidates = candidates.filter(submission__in=SequenceSubmission.objects.filter(user=user).values('id'))
+    candidate_ids = (candidates.values('submission').annotate(shared=Count('id'))
+                     .order_by('-shared').values_list('submission', flat=True)[:MAX_CANDIDATES])
+    submissions = SequenceSubmission.objects.filter(id__in=list(candidate_ids)).only(
+        'id', 'sequence', 'status', 'result', 'adapter_results', 'submit_date', 'result_date')
+
+    best = {}
+    for submission in submissions:
+        key = submission.sequence.upper()
+        if key not in best or submission.submit_date > best[key][1].submit_date:
+            best[key] = (jaccard(query, kmers(submission.sequence)), submission)
+    return sorted(best.values(), key=lambda pair: (-pair[0], -pair[1].id))[:k]
+
+
+def motif_search(motif):
+    """Return the submissions containing `motif` ('.' matches any residue), or None if it cannot use the index.
+
+    Candidates are the submissions holding every k-mer of the motif's fixed runs, found in
+    the k-mer index; only those are checked against the motif itself."""
+    motif = motif.strip().upper()
+    if not _MOTIF.match(motif):
+        return None
+    codes = set()
+    for part in motif.split('.'):
+        codes |= kmers(part)
+    if not codes:
+        return None
+    candidates = (SequenceKmer.objects.filter(kmer__in=codes).values('submission')
+                  .annotate(found=Count('kmer')).filter(found=len(codes)).values('submission'))
+    submissions = SequenceSubmission.objects.filter(id__in=candidates)
+    if '.' in motif:
+        return submissions.filter(sequence__iregex=motif)
+    return submissions.filter(sequence__icontains=motif)
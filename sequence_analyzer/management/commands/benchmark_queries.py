@@ -0,0 +1,100 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from sequence_analyzer.models import SequenceSubmission, UserProfile
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+BENCH_PREFIX = 'bench_user_'
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database with synthetic submissions and report query plans '
+            'and timings for the hot SequenceSubmission/UserProfile queries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Number of submissions to seed')
+        parser.add_argument('--users', type=int, default=10_000, help='Number of users to seed')
+        parser.add_argument('--pending', type=float, default=0.01, help='Fraction of submissions left pending')
+        parser.add_argument('--repeat', type=int, default=20, help='Timing repetitions per query')
+
+    def handle(self, *args, **options):
+        # Never seed the configured database: build and migrate a test database next to it
+        # (test_<NAME>, or TEST['NAME'] from the settings) and drop it afterwards
+        old_name = connection.settings_dict['NAME']
+        test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.stdout.write(f"Seeding {options['rows']} submissions into the test database {test_name}")
+        try:
+            users = self.seed(options['rows'], options['users'], options['pending'])
+            self.report(users, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, rows, n_users, pending, batch_size=10_000):
+        User.objects.bulk_create(
+            [User(username=f'{BENCH_PREFIX}{i}') for i in range(n_users)], batch_size=batch_size)
+        users = list(User.objects.filter(username__startswith=BENCH_PREFIX).values_list('id', flat=True))
+        # bulk_create skips the post_save signal that normally creates profiles
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id, email_verified=True) for user_id in users], batch_size=batch_size)
+
+        # Raw inserts, since auto_now_add would overwrite the spread of submit dates
+        now = timezone.now()
+        table = SequenceSubmission._meta.db_table
+        query = (f'INSERT INTO {table} (user_id, sequence, status, submit_date, result, result_date, '
+                 f'adapter_results, worker_id, priority) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)')
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, batch_size):
+                params = []
+                for _ in range(min(batch_size, rows - offset)):
+                    submit_date = now - timedelta(seconds=random.randint(0, 365 * 24 * 3600))
+                    is_pending = random.random() < pending
+                    params.append((
+                        random.choice(users),
+                        ''.join(random.choices(AMINO_ACIDS, k=random.randint(100, 130))),
+                        'pending' if is_pending else 'done',
+                        submit_date,
+                        0 if is_pending else random.random(),
+                        None if is_pending else submit_date + timedelta(minutes=10),
+                        '{}',
+                        '',
+                        0,
+                    ))
+                with transaction.atomic():
+                    cursor.executemany(query, params)
+        self.stdout.write(f'Seeded {rows} rows in {time.perf_counter() - start:.1f}s')
+        return users
+
+    def report(self, users, repeat):
+        user_id = random.choice(users)
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        token = UserProfile.objects.filter(user_id=user_id).values_list('verification_token', flat=True).get()
+
+        queries = {
+            'pending scan (wrapper)': SequenceSubmission.objects.filter(
+                status='pending').order_by('-priority', 'submit_date').values_list('id', 'sequence')[:500],
+            'daily limit, date-function lookups (old)': SequenceSubmission.objects.filter(
+                user_id=user_id, submit_date__year=today.year, submit_date__month=today.month,
+                submit_date__day=today.day),
+            'daily limit, half-open range': SequenceSubmission.objects.filter(
+                user_id=user_id, submit_date__gte=today, submit_date__lt=today + timedelta(days=1)),
+            'verification token lookup': UserProfile.objects.filter(verification_token=token),
+            'unknown verification token': UserProfile.objects.filter(verification_token=uuid.uuid4()),
+        }
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(f'median {timings[len(timings) // 2]:.3f} ms, max {timings[-1]:.3f} ms\n')
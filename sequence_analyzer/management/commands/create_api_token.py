@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from sequence_analyzer.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Create a JSON API token for a user and print its key.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='', help='Label to tell tokens apart')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+        token = ApiToken.objects.create(user=user, name=options['name'])
+        self.stdout.write(token.key)
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sequence_analyzer.kmer_index import index_submissions
+from sequence_analyzer.models import SequenceKmer, SequenceSketch, SequenceSubmission
+
+
+class Command(BaseCommand):
+    help = ('Build the k-mer and MinHash indexes used for motif search and similar-sequence lookups '
+            'from the stored submissions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Submissions indexed per transaction')
+        parser.add_argument('--clear', action='store_true',
+                            help='Drop the existing index first (needed after changing KMER_SIZE or the bands); '
+                                 'otherwise only missing entries are added')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['clear']:
+            SequenceKmer.objects.all().delete()
+            SequenceSketch.objects.all().delete()
+            self.stdout.write('Cleared the sequence index')
+
+        # Walk the table by primary key, so each batch is an index range scan
+        last_id, done = 0, 0
+        while True:
+            batch = list(SequenceSubmission.objects.filter(id__gt=last_id).order_by('id')
+                         .values_list('id', 'sequence')[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                index_submissions(batch)
+            last_id = batch[-1][0]
+            done += len(batch)
+        self.stdout.write(f'Indexed {done} submissions in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,30 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from sequence_analyzer.outbox import send_queued
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails over a reused SMTP connection, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Messages per SMTP connection (default: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll for new messages')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+
+        while True:
+            sent, failed = send_queued(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed')
+            if not options['loop'] or stopping:
+                break
+            # A full batch may mean more are waiting, so only sleep when idle
+            if not sent and not failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,195 @@
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .models import OutboundEmail, SequenceSubmission
+
+# Upper bounds (seconds) of the view latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """Per-view request latency.
+
+    Counts are kept in memory by each worker process. With a `directory`, every process
+    also writes its counts to latency_<pid>.json there (at most every `flush_interval`
+    seconds), and snapshot() adds up the files of all processes, so any Gunicorn worker
+    serves the same, monotonically growing totals."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, directory=None, flush_interval=1.0):
+        self.buckets = buckets
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        # view name -> [bucket counts..., sum, count]
+        self.views = {}
+        self.flushed_at = 0.0
+        if directory:
+            atexit.register(self.flush)
+
+    def observe(self, view, seconds):
+        with self.lock:
+            row = self.views.setdefault(view, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += seconds
+            row[-1] += 1
+        if self.directory and time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process's counts to its file, replacing it atomically."""
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            data = json.dumps(self.views)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'latency_{os.getpid()}.json')
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def snapshot(self):
+        if not self.directory:
+            with self.lock:
+                return {view: list(row) for view, row in self.views.items()}
+        self.flush()
+        totals = {}
+        for name in os.listdir(self.directory):
+            if not (name.startswith('latency_') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    views = json.load(f)
+            except (OSError, ValueError):
+                # Removed or replaced while listing
+                continue
+            for view, row in views.items():
+                total = totals.setdefault(view, [0] * len(self.buckets) + [0.0, 0])
+                for i, value in enumerate(row):
+                    total[i] += value
+        return totals
+
+
+view_latency = LatencyHistogram(directory=settings.METRICS_DIR)
+
+
+class MetricsMiddleware:
+    """Record the time each resolved view takes to return its response."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, seconds):
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths (404s) are grouped so scanners cannot grow the label set
+        view_latency.observe(match.view_name if match and match.view_name else 'unresolved', seconds)
+
+
+def last_wrapper_run(path):
+    """Return the last JSON line of the wrapper timing log, or None if there is none."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as log:
+        log.seek(0, os.SEEK_END)
+        # Only the tail of the file is needed, however long the log has grown
+        log.seek(max(0, log.tell() - 65536))
+        lines = log.read().splitlines()
+    for line in reversed(lines):
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    return None
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+def render_metrics():
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            lines.append(f'{name}{labels} {value}')
+
+    metric('aspred_queue_depth', 'gauge', 'Submissions waiting for a prediction.',
+           [('', SequenceSubmission.objects.filter(status='pending').count())])
+    metric('aspred_processing', 'gauge', 'Submissions leased to a wrapper worker.',
+           [('', SequenceSubmission.objects.filter(status='processing').count())])
+    metric('aspred_outbox_queued', 'gauge', 'Emails waiting in the outbox.',
+           [('', OutboundEmail.objects.filter(status='queued').count())])
+
+    lines.append('# HELP aspred_view_latency_seconds Time taken by each view to return a response.')
+    lines.append('# TYPE aspred_view_latency_seconds histogram')
+    for view, row in sorted(view_latency.snapshot().items()):
+        for bound, value in zip(view_latency.buckets, row):
+            lines.append(f'aspred_view_latency_seconds_bucket{_labels(view=view, le=bound)} {value}')
+        lines.append(f'aspred_view_latency_seconds_bucket{_labels(view=view, le="+Inf")} {row[-1]}')
+        lines.append(f'aspred_view_latency_seconds_sum{_labels(view=view)} {row[-2]}')
+        lines.append(f'aspred_view_latency_seconds_count{_labels(view=view)} {row[-1]}')
+
+    run = last_wrapper_run(settings.WRAPPER_TIMING_LOG)
+    if run:
+        metric('aspred_last_batch_sequences', 'gauge', 'Submissions processed by the last wrapper run.',
+               [('', run.get('counts', {}).get('sequences', 0))])
+        metric('aspred_last_batch_sequences_per_second', 'gauge', 'End-to-end throughput of the last wrapper run.',
+               [('', run.get('sequences_per_second', 0))])
+        metric('aspred_last_batch_stage_seconds', 'gauge', 'Time spent in each stage of the last wrapper run.',
+               [(_labels(stage=stage), seconds) for stage, seconds in sorted(run.get('stages', {}).items())])
+        if run.get('queue_wait'):
+            metric('aspred_last_batch_queue_wait_seconds', 'gauge',
+                   'Time from submission to claim of the submissions in the last wrapper run.',
+                   [(_labels(stat=stat), seconds) for stat, seconds in sorted(run['queue_wait'].items())])
+        metric('aspred_last_batch_finished_timestamp_seconds', 'gauge', 'When the last wrapper run finished.',
+               [('', datetime.fromisoformat(run['finished']).timestamp())])
+
+    return '\n'.join(lines) + '\n'
+
+
+def _metrics_allowed(request):
+    """Accept the METRICS_TOKEN bearer token if one is set, otherwise a client in METRICS_ALLOWED_IPS."""
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), settings.METRICS_TOKEN)
+    # Behind a proxy REMOTE_ADDR is the proxy itself; METRICS_CLIENT_IP_HEADER names the
+    # header it sets to the real client address (only trust one the proxy always overwrites)
+    client_ip = request.META.get(settings.METRICS_CLIENT_IP_HEADER or 'REMOTE_ADDR', '')
+    return client_ip.split(',')[-1].strip() in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    """Prometheus text exposition of queue depth, view latency and wrapper throughput."""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
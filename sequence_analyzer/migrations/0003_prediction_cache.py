@@ -0,0 +1,36 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:12
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0002_userprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence_hash', models.CharField(max_length=64)),
+                ('model_version', models.CharField(max_length=64)),
+                ('threshold', models.FloatField()),
+                ('result', models.FloatField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_hit', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='sequencesubmission',
+            name='sequence',
+            field=models.CharField(max_length=130, validators=[django.core.validators.RegexValidator(code='invalid_sequence', message='Sequence must contain only valid amino acid letters (ACDEFGHIKLMNPQRSTVWY)', regex='^[acdefghiklmnpqrstvwxyACDEFGHIKLMNPQRSTVWY]+$'), django.core.validators.MaxLengthValidator(130)]),
+        ),
+        migrations.AddConstraint(
+            model_name='predictioncache',
+            constraint=models.UniqueConstraint(fields=('model_version', 'threshold', 'sequence_hash'), name='unique_prediction_cache_key'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:15
+
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0003_prediction_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='verification_token',
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='sequencesubmission',
+            index=models.Index(fields=['status', 'submit_date'], name='submission_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sequencesubmission',
+            index=models.Index(fields=['user', 'submit_date'], name='submission_user_date_idx'),
+        ),
+    ]
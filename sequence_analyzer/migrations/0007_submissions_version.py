@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0006_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='submissions_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
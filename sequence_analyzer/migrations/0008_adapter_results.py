@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0007_submissions_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sequencesubmission',
+            name='adapter_results',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0008_adapter_results'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sequencesubmission',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sequencesubmission',
+            name='worker_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='sequencesubmission',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='sequencesubmission',
+            index=models.Index(fields=['status', 'lease_expires'], name='submission_status_lease_idx'),
+        ),
+    ]
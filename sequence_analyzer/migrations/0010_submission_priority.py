@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0009_submission_lease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='sequencesubmission',
+            name='submission_status_date_idx',
+        ),
+        migrations.AddField(
+            model_name='sequencesubmission',
+            name='claim_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sequencesubmission',
+            name='priority',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='sequencesubmission',
+            index=models.Index(fields=['status', '-priority', 'submit_date'], name='submission_queue_idx'),
+        ),
+    ]
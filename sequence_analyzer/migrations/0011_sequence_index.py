@@ -0,0 +1,43 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0010_submission_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceKmer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kmer', models.PositiveIntegerField()),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kmers', to='sequence_analyzer.sequencesubmission')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SequenceSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('submission', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sketch_bands', to='sequence_analyzer.sequencesubmission')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sequencekmer',
+            constraint=models.UniqueConstraint(fields=('kmer', 'submission'), name='unique_kmer_submission'),
+        ),
+        migrations.AddIndex(
+            model_name='sequencesketch',
+            index=models.Index(fields=['band', 'bucket'], name='sketch_band_bucket_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='sequencesketch',
+            constraint=models.UniqueConstraint(fields=('submission', 'band'), name='unique_sketch_submission_band'),
+        ),
+    ]
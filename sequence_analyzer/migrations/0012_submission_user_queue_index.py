@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 13:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sequence_analyzer', '0011_sequence_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sequencesubmission',
+            index=models.Index(fields=['status', 'user', '-priority', 'submit_date'], name='submission_user_queue_idx'),
+        ),
+    ]
@@ -1,20 +1,50 @@
 from django.db import models
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator, MaxLengthValidator
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+import secrets
 import uuid
+from datetime import timedelta
+from django.utils import timezone
 
 # Create your models here.
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     email_verified = models.BooleanField(default=False)
-    verification_token = models.UUIDField(default=uuid.uuid4)
+    verification_token = models.UUIDField(default=uuid.uuid4, unique=True)
+    # Submissions allowed per day; empty means settings.SUBMISSION_DAILY_QUOTA
+    daily_quota = models.PositiveIntegerField(null=True, blank=True)
+    # Bumped whenever the user's submissions change; part of their cache keys
+    submissions_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    def save(self, *args, **kwargs):
+        # submissions_version is only changed by atomic F() updates (see
+        # bump_submissions_version), so never write back a possibly stale value
+        if self.pk and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'submissions_version'
+            ]
+        super().save(*args, **kwargs)
+
+    def get_daily_quota(self):
+        return self.daily_quota if self.daily_quota is not None else settings.SUBMISSION_DAILY_QUOTA
+
+    def submissions_today(self):
+        # Half-open range on submit_date so the (user, submit_date) index can be used
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        return SequenceSubmission.objects.filter(
+            user=self.user,
+            submit_date__gte=today,
+            submit_date__lt=today + timedelta(days=1)
+        ).count()
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -24,7 +54,16 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     instance.userprofile.save()
 
+def bump_submissions_version(user_ids):
+    """Invalidate the cached submissions pages of the given users."""
+    UserProfile.objects.filter(user_id__in=user_ids).update(
+        submissions_version=models.F('submissions_version') + 1
+    )
+
 class SequenceSubmission(models.Model):
+    # Statuses of submissions that are still waiting for a result
+    UNFINISHED = ('pending', 'processing')
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     sequence = models.CharField(
         max_length=130,
@@ -39,15 +78,140 @@ class SequenceSubmission(models.Model):
     )
     status = models.CharField(
         max_length=10,
-        choices=[('pending', 'Pending'), ('done', 'Done')],
+        choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done')],
         default='pending'
     )
+    # Set while a wrapper worker holds the submission ('processing'); the lease is renewed
+    # by the worker's heartbeat and an expired lease puts the submission back to 'pending'
+    worker_id = models.CharField(max_length=64, blank=True, default='')
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    # Higher priorities are claimed by the wrapper first, whatever its scheduler
+    priority = models.SmallIntegerField(default=0)
     submit_date = models.DateTimeField(auto_now_add=True)
+    # When a wrapper worker first claimed the submission; claim_date - submit_date is its queue wait
+    claim_date = models.DateTimeField(null=True, blank=True)
     result = models.FloatField(default=0)
+    # Probability per antigen adapter, {adapter name: prob_class1}; result holds the primary adapter's
+    adapter_results = models.JSONField(default=dict, blank=True)
     result_date = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-submit_date']
+        indexes = [
+            # Wrapper scan for pending work, highest priority then oldest first
+            models.Index(fields=['status', '-priority', 'submit_date'], name='submission_queue_idx'),
+            # Each user's pending queue, for the wrapper's round_robin scheduler
+            models.Index(fields=['status', 'user', '-priority', 'submit_date'], name='submission_user_queue_idx'),
+            # Per-user history and the daily submission limit
+            models.Index(fields=['user', 'submit_date'], name='submission_user_date_idx'),
+            # Reclaim of expired leases
+            models.Index(fields=['status', 'lease_expires'], name='submission_status_lease_idx'),
+        ]
 
     def __str__(self):
         return f"Sequence submission by {self.user.username} on {self.submit_date}"
+
+    @property
+    def queue_wait(self):
+        """Time between submission and the first claim by a wrapper worker, or None if not claimed yet."""
+        if self.claim_date is None:
+            return None
+        return self.claim_date - self.submit_date
+
+@receiver(post_save, sender=SequenceSubmission)
+def invalidate_submissions_cache(sender, instance, **kwargs):
+    bump_submissions_version([instance.user_id])
+
+@receiver(post_save, sender=SequenceSubmission)
+def index_new_submission(sender, instance, created, **kwargs):
+    # Sequences do not change after submission, so only new ones need indexing
+    if created:
+        from .kmer_index import index_submissions
+        index_submissions([(instance.pk, instance.sequence)])
+
+class SequenceKmer(models.Model):
+    """A distinct k-mer of a submission's sequence (see kmer_index), for indexed motif search."""
+    submission = models.ForeignKey(SequenceSubmission, on_delete=models.CASCADE, related_name='kmers')
+    # Residues packed 5 bits each
+    kmer = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kmer', 'submission'], name='unique_kmer_submission'),
+        ]
+
+class SequenceSketch(models.Model):
+    """One MinHash band of a submission's sequence (see kmer_index), for similar-sequence lookups."""
+    submission = models.ForeignKey(SequenceSubmission, on_delete=models.CASCADE, related_name='sketch_bands',
+                                   db_index=False)
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['submission', 'band'], name='unique_sketch_submission_band'),
+        ]
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='sketch_band_bucket_idx'),
+        ]
+
+class ApiToken(models.Model):
+    """Key for the JSON API, sent as 'Authorization: Token <key>'."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens')
+    key = models.CharField(max_length=40, unique=True, editable=False)
+    name = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = secrets.token_hex(20)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"API token {self.name or self.key[:8]} for {self.user.username}"
+
+class PredictionCache(models.Model):
+    """Model output for a normalized sequence, reused by the wrapper for resubmissions."""
+    sequence_hash = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=64)
+    threshold = models.FloatField()
+    result = models.FloatField()
+    hits = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    last_hit = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model_version', 'threshold', 'sequence_hash'],
+                name='unique_prediction_cache_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Cached prediction {self.sequence_hash[:12]} ({self.model_version[:12]})"
+
+
+class OutboundEmail(models.Model):
+    """Queued email, delivered by the send_outbox management command."""
+    STATUS_CHOICES = [('queued', 'Queued'), ('sent', 'Sent'), ('failed', 'Failed')]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Email '{self.subject}' to {', '.join(self.to)} ({self.status})"
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+def queue_mail(subject, message, from_email, recipient_list, html_message=None):
+    """Queue an email for the outbox sender; same arguments as django.core.mail.send_mail."""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        delay = settings.OUTBOX_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def send_queued(batch_size=None):
+    """Send due queued emails over one SMTP connection; return (sent, failed) counts.
+
+    Messages go through the configured EMAIL_BACKEND, so the production
+    CustomEmailBackend still adds the X-PM-Message-Stream header. Run a single
+    sender at a time."""
+    due = list(
+        OutboundEmail.objects
+        .filter(status='queued', next_attempt_at__lte=timezone.now())
+        .order_by('next_attempt_at', 'id')[:batch_size or settings.OUTBOX_BATCH_SIZE]
+    )
+    if not due:
+        return 0, 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Server unreachable: back off every message in the batch
+        for email in due:
+            _record_failure(email, e)
+        return 0, len(due)
+
+    sent = failed = 0
+    try:
+        for email in due:
+            message = EmailMultiAlternatives(
+                email.subject, email.body, email.from_email, email.to, connection=connection
+            )
+            if email.html_body:
+                message.attach_alternative(email.html_body, 'text/html')
+            try:
+                message.send()
+            except Exception as e:
+                _record_failure(email, e)
+                failed += 1
+                continue
+            email.status = 'sent'
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.save(update_fields=['status', 'attempts', 'sent_at'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -1,3 +1,752 @@
-from django.test import TestCase
+import asyncio
+import atexit
+import importlib.util
+import itertools
+import json
+import os
+import signal
+import smtplib
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .forms import SequenceSubmissionForm
+from .kmer_index import motif_search, similar_submissions
+from .metrics import LatencyHistogram
+from .models import ApiToken, OutboundEmail, SequenceSubmission
+from .outbox import queue_mail, send_queued
+
+HEAVY = 'QVQLVQSGAEVKKPGASVKVSCKASGYTFTSYGISWVRQAPGQGLEWMGWISAYNGNTNYAQKLQGRVTMTTDTSTSTAYMELRSLRSDDTAVYYCAR'
+LIGHT = 'DIQMTQSPSSLSASVGDRVTITCRASQSISSYLNWYQQKPGKAPKLLIYAASSLQSGVPSRFSGSGSGTDFTLTISSLQPEDFATYYCQQSYSTPLT'
+
+
+WRAPPER = Path(__file__).resolve().parent.parent / 'wrapper' / 'aspredwrapper.py'
+
+
+def wrapper_importable():
+    try:
+        import dotenv  # noqa: F401
+        import mysql.connector  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_wrapper_copies = itertools.count()
+
+
+def load_wrapper(*args):
+    """Import a fresh copy of aspredwrapper.py, configured as if started with `args`."""
+    spec = importlib.util.spec_from_file_location(f'aspredwrapper_{next(_wrapper_copies)}', WRAPPER)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.object(sys, 'argv', [str(WRAPPER), *args]):
+        spec.loader.exec_module(module)
+    return module
+
+
+@skipUnless(connection.vendor == 'sqlite' and wrapper_importable(),
+            'needs SQLite and the wrapper dependencies (mysql-connector-python, python-dotenv)')
+class WrapperTestCase(TransactionTestCase):
+    """Runs aspredwrapper.py functions in this process against a file copy of the test database."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.database = os.path.join(self.tmp, 'queue.sqlite3')
+        self.model_path = os.path.join(self.tmp, 'adapter')
+        os.makedirs(self.model_path)
+        with open(os.path.join(self.model_path, 'adapter_config.json'), 'w') as f:
+            f.write('{"r": 8}')
+        # The wrapper writes its CSV files and journal to the working directory
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, cwd)
+
+    def copy_database(self):
+        """Copy the test database, with everything created so far, to the file the wrapper uses."""
+        connection.ensure_connection()
+        with sqlite3.connect(self.database) as target:
+            connection.connection.backup(target)
+
+    def query(self, sql, params=()):
+        with sqlite3.connect(self.database) as db:
+            return db.execute(sql, params).fetchall()
+
+    def wrapper(self, *args):
+        if not os.path.exists(self.database):
+            self.copy_database()
+        return load_wrapper('--infpath', self.tmp, '--modelpath', self.model_path, '--sqlite', self.database,
+                            '--server', 'http://127.0.0.1:9', '--timing_log', os.path.join(self.tmp, 'timings.jsonl'),
+                            *args)
+
+
+def make_user(username='alice', verified=True, quota=None):
+    user = User.objects.create_user(username, password='secret')
+    user.userprofile.email_verified = verified
+    user.userprofile.daily_quota = quota
+    user.userprofile.save()
+    return user
+
+
+class SubmitSequencesApiTests(TestCase):
+    def setUp(self):
+        self.user = make_user(quota=3)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {ApiToken.objects.create(user=self.user).key}'}
+
+    def post(self, body, **headers):
+        return self.client.post(reverse('api_submit_sequences'), json.dumps(body),
+                                content_type='application/json', **{**self.auth, **headers})
+
+    def test_requires_a_valid_token(self):
+        self.assertEqual(self.post({'sequences': [HEAVY]}, HTTP_AUTHORIZATION='').status_code, 401)
+        self.assertEqual(self.post({'sequences': [HEAVY]}, HTTP_AUTHORIZATION='Token nope').status_code, 401)
+
+    def test_requires_verified_email(self):
+        self.user.userprofile.email_verified = False
+        self.user.userprofile.save()
+        self.assertEqual(self.post({'sequences': [HEAVY]}).status_code, 403)
+
+    def test_rejects_malformed_bodies(self):
+        self.assertEqual(self.post([HEAVY]).status_code, 400)
+        self.assertEqual(self.post({'sequences': []}).status_code, 400)
+        self.assertEqual(self.post({'sequences': HEAVY}).status_code, 400)
+
+    @override_settings(API_MAX_BATCH_SIZE=2)
+    def test_rejects_oversized_batches(self):
+        self.assertEqual(self.post({'sequences': [HEAVY, LIGHT, HEAVY]}).status_code, 400)
+
+    def test_one_invalid_sequence_rejects_the_batch(self):
+        response = self.post({'sequences': [HEAVY, 'QVQL123', 42]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['details']), {'1', '2'})
+        self.assertFalse(SequenceSubmission.objects.exists())
+
+    def test_quota(self):
+        response = self.post({'sequences': [HEAVY, LIGHT]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        # One left today: a batch of two is refused as a whole
+        self.assertEqual(self.post({'sequences': [HEAVY, LIGHT]}).status_code, 429)
+        self.assertEqual(self.post({'sequences': [HEAVY]}).status_code, 201)
+        self.assertEqual(SequenceSubmission.objects.filter(user=self.user).count(), 3)
+
+
+@override_settings(API_EXPORT_CHUNK_SIZE=2)
+class ExportResultsApiTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {ApiToken.objects.create(user=self.user).key}'}
+        self.ids = [SequenceSubmission.objects.create(user=self.user, sequence=HEAVY[:20 + i]).id
+                    for i in range(5)]
+        SequenceSubmission.objects.filter(id=self.ids[1]).update(status='done', result=0.25)
+        SequenceSubmission.objects.create(user=make_user('bob'), sequence=LIGHT)
+
+    def export(self, **params):
+        response = self.client.get(reverse('api_export_results'), params, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_covers_every_chunk_in_id_order(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.ids)
+
+    def test_status_filter_and_csv(self):
+        lines = self.export(format='csv', status='done').splitlines()
+        self.assertEqual(lines[0].split(','), ['id', 'sequence', 'status', 'result', 'adapter_results',
+                                               'submit_date', 'result_date'])
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(self.ids[1])])
+
+
+@override_settings(SUBMISSIONS_PAGE_SIZE=2)
+class ViewSubmissionsPaginationTests(TestCase):
+    def setUp(self):
+        # Pages are cached per user id, and ids repeat across tests
+        cache.clear()
+        self.user = make_user()
+        same_time = timezone.now()
+        self.ids = []
+        for i in range(5):
+            submission = SequenceSubmission.objects.create(user=self.user, sequence=HEAVY[:20 + i])
+            self.ids.append(submission.id)
+        # Two rows share a submit_date, so the cursor has to break the tie on id
+        SequenceSubmission.objects.filter(id__in=self.ids[1:3]).update(submit_date=same_time)
+        self.client.force_login(self.user)
+
+    def test_pages_cover_every_submission_once(self):
+        seen, after = [], None
+        while True:
+            response = self.client.get(reverse('view_submissions'), {'after': after} if after else {})
+            page = response.context['submissions']
+            self.assertLessEqual(len(page), 2)
+            seen.extend(submission.id for submission in page)
+            after = response.context['next_cursor']
+            if after is None:
+                break
+        self.assertEqual(sorted(seen), self.ids)
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_malformed_cursor_shows_the_first_page(self):
+        response = self.client.get(reverse('view_submissions'), {'after': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['submissions']), 2)
+
+
+@override_settings(SUBMISSION_STATUS_POLL_INTERVAL=0.05, SUBMISSION_STATUS_TIMEOUT=0.3)
+class SubmissionStatusStreamTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.done = SequenceSubmission.objects.create(user=self.user, sequence=HEAVY)
+        self.pending = SequenceSubmission.objects.create(user=self.user, sequence=LIGHT)
+        SequenceSubmission.objects.filter(id=self.done.id).update(
+            status='done', result=0.5, result_date=timezone.now())
+
+    async def stream(self, login=True, **params):
+        client = AsyncClient()
+        if login:
+            await client.aforce_login(self.user)
+        response = await client.get(reverse('submission_status'), params)
+        if not response.streaming:
+            return response.status_code, []
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+            if 'event' in lines:
+                events.append((lines['event'], json.loads(lines['data'])))
+        return response.status_code, events
+
+    async def test_requires_login(self):
+        self.assertEqual((await self.stream(login=False))[0], 401)
+
+    async def test_rejects_malformed_ids(self):
+        self.assertEqual((await self.stream(ids='1,x'))[0], 400)
+
+    async def test_reports_rows_finished_before_connecting(self):
+        status, events = await self.stream(ids=f'{self.done.id},{self.pending.id}')
+        self.assertEqual(status, 200)
+        self.assertEqual(events[0][0], 'status')
+        self.assertEqual({key: events[0][1][key] for key in ('id', 'status', 'result')},
+                         {'id': self.done.id, 'status': 'done', 'result': '0.500'})
+        self.assertEqual(events[-1], ('end', {'pending': [self.pending.id]}))
+
+    async def test_ignores_other_users_submissions(self):
+        other = await SequenceSubmission.objects.acreate(user=await sync_to_async(make_user)('bob'), sequence=HEAVY)
+        self.assertEqual((await self.stream(ids=str(other.id)))[1], [('end', {'pending': []})])
+
+    async def test_ends_when_everything_is_done(self):
+        async def finish():
+            await asyncio.sleep(0.1)
+            await SequenceSubmission.objects.filter(id=self.pending.id).aupdate(
+                status='done', result=0.75, result_date=timezone.now())
+        task = asyncio.create_task(finish())
+        _, events = await self.stream()
+        await task
+        self.assertEqual([(name, data.get('id')) for name, data in events],
+                         [('status', self.pending.id), ('end', None)])
+        self.assertEqual(events[-1][1], {'pending': []})
+
+    def test_streams_under_wsgi(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('submission_status'), {'ids': f'{self.done.id},{self.pending.id}'})
+        self.assertFalse(response.is_async)
+        chunks = iter(response.streaming_content)
+        # The finished row is sent while the other one is still pending
+        self.assertIn(f'"id": {self.done.id}', next(chunks).decode())
+        SequenceSubmission.objects.filter(id=self.pending.id).update(
+            status='done', result=0.75, result_date=timezone.now())
+        rest = b''.join(chunks).decode()
+        self.assertIn(f'"id": {self.pending.id}', rest)
+        self.assertIn('event: end\ndata: {"pending": []}', rest)
+
+
+class SequenceIndexTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.other = make_user('bob')
+        self.heavy = SequenceSubmission.objects.create(user=self.user, sequence=HEAVY)
+        self.light = SequenceSubmission.objects.create(user=self.user, sequence=LIGHT)
+        self.bobs = SequenceSubmission.objects.create(user=self.other, sequence=HEAVY)
+
+    def test_similar_submissions_finds_near_identical_sequences(self):
+        variant = HEAVY[:50] + 'W' + HEAVY[51:]
+        matches = similar_submissions(variant, k=5, user=self.user)
+        self.assertEqual([submission.id for _, submission in matches], [self.heavy.id])
+        self.assertGreater(matches[0][0], 0.8)
+
+    def test_similar_submissions_reports_repeats_once(self):
+        matches = similar_submissions(HEAVY, k=5)
+        self.assertEqual([submission.id for _, submission in matches], [self.bobs.id])
+        self.assertEqual(matches[0][0], 1.0)
+
+    def test_motif_search(self):
+        self.assertEqual(set(motif_search('yycar').values_list('id', flat=True)), {self.heavy.id, self.bobs.id})
+        self.assertEqual(set(motif_search('TITC.ASQ').values_list('id', flat=True)), {self.light.id})
+        self.assertFalse(motif_search('WWWWW').exists())
+        # Too short for the k-mer index, or not a motif at all
+        self.assertIsNone(motif_search('YYC'))
+        self.assertIsNone(motif_search('alice@example.org'))
+
+    def test_similar_sequences_api(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {ApiToken.objects.create(user=self.user).key}'}
+        url = reverse('api_similar_sequences')
+        response = self.client.get(url, {'sequence': HEAVY, 'k': 1}, **auth)
+        self.assertEqual([match['id'] for match in response.json()['matches']], [self.heavy.id])
+        self.assertEqual(self.client.get(url, {'sequence': 'QVQL1'}, **auth).status_code, 400)
+        self.assertEqual(self.client.get(url, {'sequence': HEAVY, 'k': 'x'}, **auth).status_code, 400)
+
+
+class MetricsTests(TestCase):
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_replaces_the_ip_allowlist(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(METRICS_CLIENT_IP_HEADER='HTTP_X_REAL_IP', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_client_address_from_the_proxy_header(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_X_REAL_IP='10.0.0.6').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_X_REAL_IP='10.0.0.5').status_code, 200)
+
+    def test_histograms_are_summed_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            histogram = LatencyHistogram(directory=directory)
+            self.addCleanup(atexit.unregister, histogram.flush)
+            histogram.observe('home', 0.02)
+            # Counts another worker process has written
+            other = [0] * len(histogram.buckets) + [0.0, 0]
+            other[-2:] = [3.0, 1]
+            for i, bound in enumerate(histogram.buckets):
+                other[i] = int(bound >= 3.0)
+            with open(os.path.join(directory, 'latency_1.json'), 'w') as f:
+                json.dump({'home': other}, f)
+            row = histogram.snapshot()['home']
+            self.assertEqual(row[-1], 2)
+            self.assertAlmostEqual(row[-2], 3.02)
+            self.assertEqual(row[histogram.buckets.index(0.025)], 1)
+            self.assertEqual(row[histogram.buckets.index(5.0)], 2)
+
+
+class FakeInferenceServer(ThreadingHTTPServer):
+    """Stand-in for aspredINF/serve.py that scores a sequence as len(sequence) / 1000."""
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.scored = Counter()
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), FakeInferenceHandler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class FakeInferenceHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.reply({'status': 'ok', 'precision': 'fp32', 'model_paths': [self.server.model_path]})
+
+    def do_POST(self):
+        sequences = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['sequences']
+        # Slow enough that every worker has started before the queue is drained
+        time.sleep(0.1)
+        with self.server.lock:
+            self.server.scored.update(sequences)
+        self.reply({'prob_class1': [len(sequence) / 1000 for sequence in sequences]})
+
+
+@skipUnless(connection.vendor == 'sqlite' and wrapper_importable(),
+            'needs SQLite and the wrapper dependencies (mysql-connector-python, python-dotenv)')
+class ConcurrentWrapperTests(TransactionTestCase):
+    """Several aspredwrapper.py processes draining one queue, each submission scored exactly once."""
+
+    def test_workers_share_the_queue_without_duplicates(self):
+        user = make_user()
+        sequences = [HEAVY[:30 + i % 60] + 'ACDEFGHIKLMNPQRSTVWY'[i % 20] * (i // 60 + 1) for i in range(120)]
+        SequenceSubmission.objects.bulk_create([SequenceSubmission(user=user, sequence=seq) for seq in sequences])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # The wrapper needs a database file; copy the in-memory test database into one
+            path = os.path.join(tmp, 'queue.sqlite3')
+            connection.ensure_connection()
+            with sqlite3.connect(path) as target:
+                connection.connection.backup(target)
+            model_path = os.path.join(tmp, 'adapter')
+            os.makedirs(model_path)
+            server = FakeInferenceServer(os.path.realpath(model_path))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.addCleanup(server.shutdown)
+
+            workers = []
+            for n in range(4):
+                workdir = os.path.join(tmp, f'worker{n}')
+                os.makedirs(workdir)
+                workers.append(subprocess.Popen(
+                    [sys.executable, str(WRAPPER), '--infpath', tmp, '--modelpath', model_path,
+                     '--sqlite', path, '--server', server.url, '--worker_id', f'worker{n}',
+                     '--run_chunk_size', '7'],
+                    cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True))
+            outputs = [worker.communicate(timeout=120)[0] for worker in workers]
+
+            with sqlite3.connect(path) as db:
+                rows = db.execute('SELECT sequence, status, result, worker_id, lease_expires '
+                                  'FROM sequence_analyzer_sequencesubmission').fetchall()
+        self.assertTrue(all(worker.returncode == 0 for worker in workers), outputs)
+        # Every worker got a share of the work
+        self.assertTrue(all('Chunk 1/1' in output for output in outputs), outputs)
+        self.assertEqual(sum(server.scored.values()), len(sequences))
+        self.assertEqual(max(server.scored.values()), 1)
+        for sequence, status, result, worker_id, lease_expires in rows:
+            self.assertEqual((status, worker_id, lease_expires), ('done', '', None))
+            self.assertAlmostEqual(result, len(sequence) / 1000)
+
+
+class SubmissionAdminSearchTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.heavy = SequenceSubmission.objects.create(user=self.user, sequence=HEAVY)
+        self.light = SequenceSubmission.objects.create(user=self.user, sequence=LIGHT)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.org', 'secret'))
+
+    def search(self, term):
+        response = self.client.get(reverse('admin:sequence_analyzer_sequencesubmission_changelist'), {'q': term})
+        return set(response.context['cl'].result_list.values_list('id', flat=True))
+
+    def test_motifs_use_the_index(self):
+        self.assertEqual(self.search('YYCAR'), {self.heavy.id})
+        self.assertEqual(self.search('TITC.ASQ'), {self.light.id})
+
+    def test_terms_the_index_cannot_serve_fall_back_to_a_scan(self):
+        self.assertEqual(self.search('YYC'), {self.heavy.id, self.light.id})
+        self.assertEqual(self.search('QQ'), {self.light.id})
+        self.assertEqual(self.search('alice'), {self.heavy.id, self.light.id})
+
+
+class PredictionCacheTests(WrapperTestCase):
+    def setUp(self):
+        super().setUp()
+        self.wrapper_module = self.wrapper()
+        self.scored = []
+        self.wrapper_module.predict_sequences = self.fake_predict
+
+    def fake_predict(self, sequences, keys):
+        self.scored.append(list(sequences))
+        return {'adapter': [len(sequence) / 1000 for sequence in sequences]}
+
+    def test_duplicates_within_a_run_are_scored_once(self):
+        results = self.wrapper_module.cached_predictions([HEAVY, LIGHT, HEAVY.lower(), f' {HEAVY} '], None)
+        self.assertEqual(self.scored, [[HEAVY, LIGHT]])
+        self.assertEqual([result['adapter'] for result in results],
+                         [len(HEAVY) / 1000, len(LIGHT) / 1000, len(HEAVY) / 1000, len(HEAVY) / 1000])
+
+    def test_later_runs_are_served_from_the_cache(self):
+        self.wrapper_module.cached_predictions([HEAVY], None)
+        results = self.wrapper_module.cached_predictions([HEAVY, LIGHT], None)
+        self.assertEqual(self.scored, [[HEAVY], [LIGHT]])
+        self.assertEqual(results[0], {'adapter': len(HEAVY) / 1000})
+        self.assertEqual(self.query('SELECT hits FROM sequence_analyzer_predictioncache ORDER BY id'), [(1,), (0,)])
+
+    def test_a_changed_model_misses_the_cache(self):
+        self.wrapper_module.cached_predictions([HEAVY], None)
+        with open(os.path.join(self.model_path, 'adapter_config.json'), 'w') as f:
+            f.write('{"r": 16}')
+        self.wrapper_module.cached_predictions([HEAVY], None)
+        self.assertEqual(self.scored, [[HEAVY], [HEAVY]])
+        self.assertEqual(self.query('SELECT COUNT(DISTINCT model_version) FROM sequence_analyzer_predictioncache'),
+                         [(2,)])
+
+    def test_the_same_model_elsewhere_shares_the_cache(self):
+        self.wrapper_module.cached_predictions([HEAVY], None)
+        copy = os.path.join(self.tmp, 'copy', 'adapter')
+        os.makedirs(copy)
+        with open(os.path.join(copy, 'adapter_config.json'), 'w') as f:
+            f.write('{"r": 8}')
+        other = self.wrapper('--modelpath', copy)
+        other.predict_sequences = self.fake_predict
+        other.cached_predictions([HEAVY], None)
+        self.assertEqual(self.scored, [[HEAVY]])
+
+
+@override_settings(TIME_ZONE='Europe/Berlin')
+class DailyQuotaTests(TestCase):
+    # 00:30 in Berlin is still the previous day in UTC, so this also checks that the
+    # quota day follows the local calendar
+    now = timezone.make_aware(datetime(2024, 3, 5, 0, 30), timezone.get_fixed_timezone(60))
+    midnight = now.replace(minute=0)
+
+    def setUp(self):
+        patcher = mock.patch('django.utils.timezone.now', return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit_at(self, user, submit_date):
+        submission = SequenceSubmission.objects.create(user=user, sequence=HEAVY)
+        SequenceSubmission.objects.filter(pk=submission.pk).update(submit_date=submit_date)
+
+    def form_errors(self, user):
+        form = SequenceSubmissionForm(User.objects.get(pk=user.pk), {'sequence': LIGHT})
+        return form.non_field_errors()
+
+    def test_counts_only_todays_submissions(self):
+        user = make_user(quota=2)
+        self.submit_at(user, self.midnight - timedelta(microseconds=1))
+        self.submit_at(user, self.midnight + timedelta(days=1))
+        self.submit_at(user, self.midnight)
+        self.assertEqual(user.userprofile.submissions_today(), 1)
+        self.assertEqual(self.form_errors(user), [])
+
+    def test_rejects_the_submission_over_the_quota(self):
+        user = make_user(quota=2)
+        self.submit_at(user, self.midnight)
+        self.submit_at(user, self.now)
+        self.assertEqual(self.form_errors(user), [
+            'You have reached your limit of 2 submissions per day. Please try again tomorrow.'])
+
+    def test_single_submission_quota_message(self):
+        user = make_user()
+        self.assertEqual(self.form_errors(user), [])
+        self.submit_at(user, self.midnight)
+        self.assertEqual(self.form_errors(user), [
+            'You have already submitted a sequence today. Please try again tomorrow.'])
+
+
+class RefusingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPDataError(550, 'Mailbox unavailable')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BACKOFF=60)
+class OutboxTests(TestCase):
+    def queue(self, count=1):
+        return [queue_mail(f'Message {i}', 'Body', None, [f'user{i}@example.org'], html_message='<p>Body</p>')
+                for i in range(count)]
+
+    def test_sends_the_batch_over_one_connection(self):
+        self.queue(3)
+        self.assertEqual(send_queued(), (3, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['Message 0', 'Message 1', 'Message 2'])
+        self.assertEqual(len({id(message.connection) for message in mail.outbox}), 1)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Body</p>', 'text/html')])
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+        self.assertEqual(send_queued(), (0, 0))
+
+    def test_batch_size(self):
+        self.queue(3)
+        self.assertEqual(send_queued(batch_size=2), (2, 0))
+        self.assertEqual(OutboundEmail.objects.filter(status='queued').count(), 1)
+
+    @override_settings(EMAIL_BACKEND='labsite.email_backend_pm.CustomEmailBackend')
+    def test_production_backend_adds_message_stream_header(self):
+        self.queue()
+        with mock.patch('django.core.mail.backends.smtp.smtplib.SMTP') as smtp:
+            self.assertEqual(send_queued(), (1, 0))
+        self.assertEqual(smtp.call_count, 1)
+        (sender, recipients, message), _ = smtp.return_value.sendmail.call_args
+        self.assertEqual(recipients, ['user0@example.org'])
+        self.assertIn(b'X-PM-Message-Stream: outbound', message)
+
+    @override_settings(EMAIL_BACKEND='sequence_analyzer.tests.RefusingEmailBackend')
+    def test_failures_back_off_then_give_up(self):
+        email, = self.queue()
+        for attempt, delay in ((1, 60), (2, 120)):
+            before = timezone.now()
+            self.assertEqual(send_queued(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('queued', attempt))
+            self.assertIn('Mailbox unavailable', email.last_error)
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=delay))
+            self.assertLessEqual(email.next_attempt_at, timezone.now() + timedelta(seconds=delay))
+            # Not due again until the backoff has passed
+            self.assertEqual(send_queued(), (0, 0))
+            OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+
+        self.assertEqual(send_queued(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 3))
+        self.assertEqual(send_queued(), (0, 0))
+
+    def test_unreachable_server_backs_off_the_whole_batch(self):
+        self.queue(2)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=ConnectionRefusedError):
+            self.assertEqual(send_queued(), (0, 2))
+        self.assertEqual(list(OutboundEmail.objects.values_list('status', 'attempts')), [('queued', 1)] * 2)
+        self.assertFalse(OutboundEmail.objects.filter(next_attempt_at__lte=timezone.now()).exists())
+
+    def test_send_outbox_command(self):
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        self.queue(2)
+        out = StringIO()
+        call_command('send_outbox', stdout=out)
+        self.assertEqual(out.getvalue(), 'Sent 2 emails, 0 failed\n')
+        self.assertEqual(len(mail.outbox), 2)
+
+    @mock.patch('captcha.fields.ReCaptchaField.validate')
+    def test_register_queues_the_verification_email(self, validate):
+        response = self.client.post(reverse('register'), {
+            'username': 'carol', 'email': 'carol@example.org',
+            'password1': 'a-long-passphrase', 'password2': 'a-long-passphrase',
+            'g-recaptcha-response': 'test',
+        })
+        self.assertRedirects(response, reverse('dashboard'))
+        self.assertEqual(mail.outbox, [])
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.to, email.status), (['carol@example.org'], 'queued'))
+        token = User.objects.get(username='carol').userprofile.verification_token
+        self.assertIn(reverse('verify_email', args=[token]), email.body)
+
+
+class SubmissionsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user(quota=5)
+        self.submission = SequenceSubmission.objects.create(user=self.user, sequence=HEAVY)
+        self.client.force_login(self.user)
+
+    def submissions(self):
+        return [(submission.sequence, submission.status)
+                for submission in self.client.get(reverse('view_submissions')).context['submissions']]
+
+    def test_save_invalidates_the_cached_page(self):
+        self.assertEqual(self.submissions(), [(HEAVY, 'pending')])
+        self.submission.status = 'done'
+        self.submission.save()
+        self.assertEqual(self.submissions(), [(HEAVY, 'done')])
+
+    def test_bulk_create_invalidates_the_cached_page(self):
+        self.assertEqual(len(self.submissions()), 1)
+        token = ApiToken.objects.create(user=self.user).key
+        response = self.client.post(reverse('api_submit_sequences'), {'sequences': [LIGHT]},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.submissions(), [(LIGHT, 'pending'), (HEAVY, 'pending')])
+
+    def test_an_unchanged_page_is_served_from_the_cache(self):
+        self.submissions()
+        # update() sends no signal, so nothing invalidates the page
+        SequenceSubmission.objects.filter(pk=self.submission.pk).update(status='done')
+        self.assertEqual(self.submissions(), [(HEAVY, 'pending')])
+
+    @override_settings(PAGE_CACHE_TIMEOUT=123)
+    def test_fragments_use_the_page_cache_timeout(self):
+        self.assertEqual(self.client.get(reverse('dashboard')).context['page_cache_timeout'], 123)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('home')).context['page_cache_timeout'], 123)
+
+
+class WrapperSubmissionsVersionTests(WrapperTestCase):
+    """Every status change the wrapper writes invalidates the owner's cached submissions pages."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.other = make_user('bob')
+        self.ids = [SequenceSubmission.objects.create(user=self.user, sequence=sequence).id
+                    for sequence in (HEAVY, LIGHT)]
+        self.wrapper_module = self.wrapper('--worker_id', 'worker1', '--lease_seconds', '60')
+
+    def versions(self):
+        return dict(self.query('SELECT user_id, submissions_version FROM sequence_analyzer_userprofile'))
+
+    def assertBumped(self, before):
+        self.assertEqual(self.versions(), {self.user.id: before[self.user.id] + 1,
+                                           self.other.id: before[self.other.id]})
+
+    def test_claim_and_release(self):
+        before = self.versions()
+        self.assertEqual(len(self.wrapper_module.claim_pending(None, 10)), 2)
+        self.assertBumped(before)
+        before = self.versions()
+        self.assertEqual(self.wrapper_module.release(None), 2)
+        self.assertBumped(before)
+
+    def test_reclaim_expired(self):
+        self.wrapper_module.claim_pending(None, 10)
+        self.query('UPDATE sequence_analyzer_sequencesubmission SET lease_expires = ?', ['2000-01-01 00:00:00'])
+        before = self.versions()
+        self.assertEqual(self.wrapper_module.reclaim_expired(None), 2)
+        self.assertBumped(before)
+        # Nothing left to reclaim, nothing to invalidate
+        before = self.versions()
+        self.assertEqual(self.wrapper_module.reclaim_expired(None), 0)
+        self.assertEqual(self.versions(), before)
+
+    def test_update_database(self):
+        self.wrapper_module.claim_pending(None, 10)
+        before = self.versions()
+        predictions = [{'adapter': 0.25}, {'adapter': 0.75}]
+        self.assertEqual(self.wrapper_module.update_database(self.ids, predictions, None), 2)
+        self.assertBumped(before)
+        self.assertEqual(self.query('SELECT status FROM sequence_analyzer_sequencesubmission'), [('done',)] * 2)
+
+
+class RunJournalTests(WrapperTestCase):
+    def setUp(self):
+        super().setUp()
+        user = make_user()
+        self.sequences = [HEAVY, LIGHT, HEAVY[:40]]
+        self.ids = [SequenceSubmission.objects.create(user=user, sequence=sequence).id for sequence in self.sequences]
+        self.wrapper_module = self.wrapper('--run_chunk_size', '2')
+        self.scored = []
+        self.wrapper_module.predict_sequences = self.fake_predict
+        self.wrapper_module.claim_pending(None, 10)
+
+    def fake_predict(self, sequences, keys):
+        self.scored.extend(sequences)
+        return {'adapter': [len(sequence) / 1000 for sequence in sequences]}
+
+    def interrupted_run(self):
+        """Journal the first chunk as if the run was killed before writing it, mid-way through the next line."""
+        self.wrapper_module.append_journal(0, {self.ids[0]: {'adapter': 0.9}, self.ids[1]: {'adapter': 0.8}})
+        with open(self.wrapper_module.ARGS.journal, 'a') as journal:
+            journal.write('{"chunk": 1, "results": {"')
+
+    def results(self):
+        return self.query('SELECT status, result FROM sequence_analyzer_sequencesubmission ORDER BY id')
+
+    def test_resumes_journaled_chunks_without_scoring_them(self):
+        self.interrupted_run()
+        self.assertEqual(self.wrapper_module.run_checkpointed(self.ids, self.sequences, None), 3)
+        self.assertEqual(self.scored, [HEAVY[:40]])
+        self.assertEqual(self.results(), [('done', 0.9), ('done', 0.8), ('done', 0.04)])
+        self.assertFalse(os.path.exists(self.wrapper_module.ARGS.journal))
+
+    def test_keeps_the_journal_until_every_result_is_written(self):
+        self.interrupted_run()
+        # Another worker took over the first submission in the meantime
+        self.query("UPDATE sequence_analyzer_sequencesubmission SET worker_id = 'worker2' WHERE id = ?", [self.ids[0]])
+        self.assertEqual(self.wrapper_module.run_checkpointed(self.ids, self.sequences, None), 2)
+        self.assertEqual(self.scored, [HEAVY[:40]])
+        self.assertTrue(os.path.exists(self.wrapper_module.ARGS.journal))
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, metrics, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -10,5 +10,10 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('submit/', views.submit_sequence, name='submit_sequence'),
     path('submissions/', views.view_submissions, name='view_submissions'),
+    path('submissions/status/', views.submission_status, name='submission_status'),
     path('verify-email/<uuid:token>/', views.verify_email, name='verify_email'),
+    path('api/submissions/', api.submit_sequences, name='api_submit_sequences'),
+    path('api/submissions/export/', api.export_results, name='api_export_results'),
+    path('api/submissions/similar/', api.similar_sequences, name='api_similar_sequences'),
+    path('metrics/', metrics.metrics_view, name='metrics'),
 ]
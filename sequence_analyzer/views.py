@@ -1,19 +1,44 @@
+import asyncio
+import json
+import time
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from django.urls import reverse
+from django.db.models import Q
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.cache import cache_page
+from functools import wraps
+from django.utils import dateformat, timezone
+from datetime import datetime
 from .forms import CustomUserCreationForm, SequenceSubmissionForm
 from .models import SequenceSubmission, UserProfile
+from .outbox import queue_mail
 
 # Create your views here.
 
+def _cache_page_for_anonymous(timeout):
+    """cache_page, but only for visitors without cookies (no session, no pending messages)"""
+    def decorator(view):
+        cached_view = cache_page(timeout)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated or set(request.COOKIES) - {settings.CSRF_COOKIE_NAME}:
+                return view(request, *args, **kwargs)
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+@_cache_page_for_anonymous(settings.PAGE_CACHE_TIMEOUT)
 def home(request):
-    return render(request, 'sequence_analyzer/home.html')
+    return render(request, 'sequence_analyzer/home.html', {'page_cache_timeout': settings.PAGE_CACHE_TIMEOUT})
 
 def register(request):
     if request.method == 'POST':
@@ -22,7 +47,7 @@ def register(request):
             user = form.save()
             login(request, user)
             
-            # Send verification email
+            # Queue the verification email; send_outbox delivers it
             verification_url = request.build_absolute_uri(
                 reverse('verify_email', args=[user.userprofile.verification_token])
             )
@@ -32,13 +57,12 @@ def register(request):
             )
             plain_message = strip_tags(html_message)
             
-            send_mail(
+            queue_mail(
                 'Verify your email address',
                 plain_message,
                 settings.DEFAULT_FROM_EMAIL,
                 [user.email],
                 html_message=html_message,
-                fail_silently=False,
             )
             
             messages.success(
@@ -62,7 +86,9 @@ def verify_email(request, token):
 
 @login_required
 def dashboard(request):
-    return render(request, 'sequence_analyzer/dashboard.html')
+    return render(request, 'sequence_analyzer/dashboard.html', {
+        'page_cache_timeout': settings.PAGE_CACHE_TIMEOUT,
+    })
 
 @login_required
 def submit_sequence(request):
@@ -82,7 +108,132 @@ def submit_sequence(request):
         form = SequenceSubmissionForm(request.user)
     return render(request, 'sequence_analyzer/submit_sequence.html', {'form': form})
 
+def _encode_cursor(submission):
+    return f"{submission.submit_date.isoformat()}_{submission.id}"
+
+def _decode_cursor(cursor):
+    """Return (submit_date, id) from a cursor string, or None if it is missing or malformed"""
+    try:
+        submit_date, _, submission_id = cursor.rpartition('_')
+        return datetime.fromisoformat(submit_date), int(submission_id)
+    except (AttributeError, ValueError):
+        return None
+
+def _page_size(request):
+    try:
+        page_size = int(request.GET.get('page_size', settings.SUBMISSIONS_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.SUBMISSIONS_PAGE_SIZE
+    return max(1, min(page_size, settings.SUBMISSIONS_MAX_PAGE_SIZE))
+
 @login_required
 def view_submissions(request):
-    submissions = SequenceSubmission.objects.filter(user=request.user)
-    return render(request, 'sequence_analyzer/view_submissions.html', {'submissions': submissions})
+    # Keyset pagination on (submit_date, id), newest first, so every page is a bounded
+    # index range scan no matter how long the user's history is
+    page_size = _page_size(request)
+    submissions = (
+        SequenceSubmission.objects
+        .filter(user=request.user)
+        .only('sequence', 'status', 'result', 'adapter_results', 'submit_date', 'result_date')
+        .order_by('-submit_date', '-id')
+    )
+    cursor = _decode_cursor(request.GET.get('after'))
+    if cursor:
+        submit_date, submission_id = cursor
+        submissions = submissions.filter(
+            Q(submit_date__lt=submit_date) | Q(submit_date=submit_date, id__lt=submission_id)
+        )
+    # Cached per user and page; any change to the user's submissions bumps the version
+    version = UserProfile.objects.values_list('submissions_version', flat=True).get(user=request.user)
+    cache_key = f"submissions:{request.user.id}:v{version}:{request.GET.get('after') if cursor else ''}:{page_size}"
+    page = cache.get(cache_key)
+    if page is None:
+        page = list(submissions[:page_size + 1])
+        cache.set(cache_key, page, settings.SUBMISSIONS_CACHE_TIMEOUT)
+    next_cursor = _encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return render(request, 'sequence_analyzer/view_submissions.html', {
+        'submissions': page[:page_size],
+        'next_cursor': next_cursor,
+        'page_size': page_size,
+        'is_first_page': cursor is None,
+    })
+
+
+def _status_event(row):
+    data = {
+        'id': row['id'],
+        'status': row['status'],
+        'result': f"{row['result']:.3f}",
+        'adapter_results': {name: f"{prob:.3f}" for name, prob in (row['adapter_results'] or {}).items()},
+        'result_date': dateformat.format(timezone.localtime(row['result_date']), 'Y-m-d H:i')
+                       if row['result_date'] else None,
+    }
+    return f"event: status\ndata: {json.dumps(data)}\n\n"
+
+def _finished_rows(remaining):
+    return SequenceSubmission.objects.filter(id__in=remaining).exclude(
+        status__in=SequenceSubmission.UNFINISHED).values('id', 'status', 'result', 'adapter_results', 'result_date')
+
+def _end_event(remaining):
+    return f"event: end\ndata: {json.dumps({'pending': sorted(remaining)})}\n\n"
+
+async def _async_status_events(pending_ids):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SUBMISSION_STATUS_TIMEOUT
+    remaining = set(pending_ids)
+    while remaining and loop.time() < deadline:
+        async for row in _finished_rows(remaining):
+            remaining.discard(row['id'])
+            yield _status_event(row)
+        if remaining:
+            # Comment line keeps proxies from closing an idle connection
+            yield ": waiting\n\n"
+            await asyncio.sleep(settings.SUBMISSION_STATUS_POLL_INTERVAL)
+    yield _end_event(remaining)
+
+def _sync_status_events(pending_ids):
+    deadline = time.monotonic() + settings.SUBMISSION_STATUS_TIMEOUT
+    remaining = set(pending_ids)
+    while remaining and time.monotonic() < deadline:
+        for row in _finished_rows(remaining):
+            remaining.discard(row['id'])
+            yield _status_event(row)
+        if remaining:
+            yield ": waiting\n\n"
+            time.sleep(settings.SUBMISSION_STATUS_POLL_INTERVAL)
+    yield _end_event(remaining)
+
+async def submission_status(request):
+    """Server-Sent Events stream of status changes for the user's pending submissions.
+
+    The submissions given in `ids` (all of the user's unfinished ones by default) are
+    watched; any that finished before the stream opened are reported straight away.
+    Only rows that are still pending are re-queried (by primary key), and the stream
+    ends once all of them are done or SUBMISSION_STATUS_TIMEOUT seconds have passed.
+    Served through labsite.wsgi every open stream holds a worker thread; serve it
+    through labsite.asgi so streams only cost a coroutine each."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    ids = request.GET.get('ids')
+    if ids:
+        try:
+            # No status filter: a row that finished after the page was rendered still gets its event
+            pending = SequenceSubmission.objects.filter(user=user, id__in=[int(i) for i in ids.split(',')])
+        except ValueError:
+            return HttpResponse("ids must be a comma-separated list of integers", status=400)
+    else:
+        pending = SequenceSubmission.objects.filter(user=user, status__in=SequenceSubmission.UNFINISHED)
+    pending_ids = {pk async for pk in pending.values_list('id', flat=True)}
+
+    # Under WSGI (runserver, sync Gunicorn) an async iterator is drained completely before
+    # anything is sent, so stream from a plain generator there instead
+    if isinstance(request, ASGIRequest):
+        events = _async_status_events(pending_ids)
+    else:
+        events = _sync_status_events(pending_ids)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -6,16 +6,63 @@ uv run python aspredwrapper.py
 or
 
 uv run python aspredwrapper.py --infpath inference_directory --modelpath model_directory
+
+If the inference server (aspredINF/serve.py) is running with the same
+--modelpath/--adapters and --precision, predictions are sent to it so the
+model does not have to be reloaded; otherwise (or if it does not answer within
+--server_timeout) run_new_set.py is started as a subprocess. With --inprocess
+the model is loaded into this process instead (uv run --extra inprocess ...),
+and no CSV files are written unless --debug_csv is given.
+
+With --watch the wrapper keeps running instead of exiting when nothing is
+pending, and flushes a batch after --max_batch sequences or --max_wait_ms,
+whichever comes first (see --profile). It stops cleanly on SIGTERM.
+
+--adapters dir1 dir2 ... scores every submission against further LoRA adapters
+on the same base model as --modelpath (start serve.py with all of them). The
+--modelpath score is stored in result, all scores in adapter_results.
+Submissions are scored --run_chunk_size at a time. Every finished chunk is
+recorded in --journal and written to the database straight away, so a run that
+is killed resumes where it stopped and loses at most one chunk.
+--modelpath may also be a snapshot from aspredINF/prepare_model.py, which
+brings its own base model and adapters and never touches the network.
+
+Any number of wrappers, on this host or others, can run against the same
+database. Each claims submissions by leasing them (status 'processing' with its
+--worker_id and an expiry --lease_seconds ahead), renews the lease while it
+scores them (until nothing has been stored for --max_claim_seconds), and only
+stores results for rows it still holds. Submissions left behind by a worker
+that died go back to pending when their lease expires.
+--sqlite db.sqlite3 runs against the development database instead of MySQL.
+
+--scheduler picks the order submissions are claimed in: fifo (oldest first),
+round_robin (each user's oldest in turn, so one bulk upload does not starve
+single-sequence users) or shortest_first (packs the most submissions into a
+--token_budget, picking from the oldest CLAIM_WINDOW claims' worth of the
+queue). Higher SequenceSubmission.priority always goes first, and submissions
+older than --max_queue_wait go before the scheduler order. The queue wait of
+every claimed submission is stored as its claim_date and summarised in the
+timing log.
 """
 
 import argparse
+import hashlib
+import json
 import mysql.connector
 import csv
 import subprocess
 import os
 import random
+import signal
+import socket
+import sqlite3
 import sys
-from datetime import datetime
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
 
@@ -30,24 +77,154 @@ def parse_arguments():
                        type=str,
                        default='/Users/sb/projects/aspred/aspredFE/aspredINF/',                       
                        help='Path to the model directory')
+    parser.add_argument('--adapters',
+                       type=str,
+                       nargs='*',
+                       default=[],
+                       help='Further LoRA adapter directories on the same base model as --modelpath; '
+                            'every submission is scored against all of them')
+    parser.add_argument('--server',
+                       type=str,
+                       default='http://127.0.0.1:8765',
+                       help='URL of the inference server (falls back to a subprocess if unreachable)')
+    parser.add_argument('--server_timeout',
+                       type=float,
+                       default=600,
+                       help='Seconds to wait for the inference server to score a batch before using the subprocess')
+    parser.add_argument('--precision',
+                       type=str,
+                       choices=['fp32', 'bf16', 'int8'],
+                       default='fp32',
+                       help='Numeric precision for the inference subprocess (the server sets its own)')
+    parser.add_argument('--write_chunk_size',
+                       type=int,
+                       default=500,
+                       help='Number of results written and committed per database UPDATE')
+    parser.add_argument('--inprocess',
+                       action='store_true',
+                       help='Import run_new_set.py from --infpath and score in this process, '
+                            'without CSV files (needs the inference dependencies installed)')
+    parser.add_argument('--debug_csv',
+                       action='store_true',
+                       help='In --inprocess mode, also write the input and predictions CSV files')
+    parser.add_argument('--run_chunk_size',
+                       type=int,
+                       default=1000,
+                       help='Number of submissions scored, journaled and written to the database at a time')
+    parser.add_argument('--subprocess_chunk_size',
+                       type=int,
+                       default=128,
+                       help='Number of sequences run_new_set.py scores before appending them to the predictions '
+                            'file; a crashed subprocess loses at most this many')
+    parser.add_argument('--journal',
+                       type=str,
+                       default=None,
+                       help='Run journal of finished chunks, used to resume an interrupted run '
+                            '(default: aspred_journal_<worker_id>.jsonl)')
+    parser.add_argument('--cache_max_age_days',
+                       type=float,
+                       default=30,
+                       help='Drop cached predictions of other model versions once unused for this many days')
+    parser.add_argument('--invalidate_cache',
+                       action='store_true',
+                       help='Drop all cached predictions of other model versions now, '
+                            'e.g. after every worker has moved to a new model')
+    parser.add_argument('--worker_id',
+                       type=str,
+                       default=socket.gethostname(),
+                       help='Name this worker leases submissions under; give each worker on a host its own')
+    parser.add_argument('--lease_seconds',
+                       type=int,
+                       default=300,
+                       help='How long claimed submissions stay leased without a heartbeat')
+    parser.add_argument('--max_claim_seconds',
+                       type=int,
+                       default=1800,
+                       help='Stop renewing leases when a claim has stored nothing for this long, '
+                            'so submissions held by a stuck worker go back to the queue')
+    parser.add_argument('--scheduler',
+                       type=str,
+                       choices=['fifo', 'round_robin', 'shortest_first'],
+                       default='fifo',
+                       help='Order pending submissions are claimed in: oldest first, one user at a time, '
+                            'or shortest sequence first')
+    parser.add_argument('--token_budget',
+                       type=int,
+                       default=None,
+                       help='Cap on the tokens (residues plus 2 per sequence) claimed at a time')
+    parser.add_argument('--max_queue_wait',
+                       type=int,
+                       default=3600,
+                       help='Seconds after which a pending submission is claimed ahead of the scheduler order, '
+                            'so long sequences or busy users are never starved')
+    parser.add_argument('--sqlite',
+                       type=str,
+                       default=None,
+                       help='Use this SQLite database (e.g. the development db.sqlite3) instead of MySQL')
+    parser.add_argument('--timing_log',
+                       type=str,
+                       default='aspred_timings.jsonl',
+                       help='File to append one JSON line of stage timings to per run (or batch in --watch mode)')
+    parser.add_argument('--watch',
+                       action='store_true',
+                       help='Keep running and score new pending submissions as they arrive')
+    parser.add_argument('--profile',
+                       type=str,
+                       choices=['latency', 'throughput'],
+                       default='latency',
+                       help='Batching defaults for --watch')
+    parser.add_argument('--max_batch',
+                       type=int,
+                       default=None,
+                       help='In --watch mode, flush once this many sequences are pending')
+    parser.add_argument('--max_wait_ms',
+                       type=int,
+                       default=None,
+                       help='In --watch mode, flush once the oldest pending sequence has waited this long')
+    parser.add_argument('--poll_interval',
+                       type=float,
+                       default=None,
+                       help='In --watch mode, seconds between database polls')
     
     args = parser.parse_args()
     
     # Verify if the paths exist
     if not os.path.exists(args.infpath):
         raise ValueError(f"Inference path does not exist: {args.infpath}")
-    if not os.path.exists(args.modelpath):
-        raise ValueError(f"Model path does not exist: {args.modelpath}")
+    for path in [args.modelpath] + args.adapters:
+        if not os.path.exists(path):
+            raise ValueError(f"Model path does not exist: {path}")
         
-    return args.infpath, args.modelpath
+    args.journal = args.journal or f"aspred_journal_{args.worker_id}.jsonl"
+    return args
 
 # Use it in your code
-INFPATH, MODELPATH = parse_arguments()
+ARGS = parse_arguments()
+INFPATH, MODELPATH, SERVER_URL, PRECISION = ARGS.infpath, ARGS.modelpath, ARGS.server, ARGS.precision
+
+
+def expand_snapshots(paths):
+    """Replace prepare_model.py snapshot directories by the adapter directories inside them"""
+    expanded = []
+    for path in paths:
+        manifest = os.path.join(path, 'snapshot.json')
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                expanded.extend(os.path.join(path, 'adapters', name) for name in json.load(f)['adapters'])
+        else:
+            expanded.append(path)
+    return expanded
+
+
+# The first model is the primary one, its score goes into the result column
+MODELPATHS = expand_snapshots([MODELPATH] + ARGS.adapters)
+ADAPTERS = [os.path.basename(os.path.normpath(path)) for path in MODELPATHS]
 
 
 curdir = os.getcwd()
 predfile = 'forASPRED.csv'
-predictedfile = predfile.split('.')[0] + '__thresh0.5_predictions.csv' 
+threshold = 0.5
+predictedfile = predfile.split('.')[0] + f'__thresh{threshold}_predictions.csv' 
 load_dotenv('.env.prod')
 db_config = {
         'user': 'sbassimain',
@@ -57,53 +234,697 @@ db_config = {
     }
 
 
-def generate_aspred_input(config):
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+
+class SqliteCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=()):
+        self.cursor.execute(query.replace('%s', '?'), params)
+
+    def executemany(self, query, params):
+        self.cursor.executemany(query.replace('%s', '?'), params)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+
+class SqliteConnection:
+    """The parts of a mysql.connector connection the wrapper uses, on a development SQLite database"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+
+    def cursor(self):
+        return SqliteCursor(self.conn.cursor())
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+# Same text format Django uses for datetime columns on SQLite
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('datetime', lambda value: datetime.fromisoformat(value.decode()))
+
+
+def connect(config):
+    if ARGS.sqlite:
+        return SqliteConnection(ARGS.sqlite)
+    return mysql.connector.connect(**config)
+
+
+def utcnow():
+    # Django stores datetimes as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Stage durations (seconds) and counters for the current run, see write_timing_log()
+run_stats = {'stages': {}, 'counts': {}, 'inference': {}, 'queue_wait': []}
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = run_stats['stages']
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - start
+
+
+def count(name, value):
+    run_stats['counts'][name] = run_stats['counts'].get(name, 0) + value
+
+
+def write_timing_log(started, mode):
+    """Append the current run's timings as one JSON line to --timing_log and reset them"""
+    total = time.perf_counter() - started
+    scored = run_stats['counts'].get('sequences', 0)
+    record = {
+        'finished': datetime.now(timezone.utc).isoformat(),
+        'mode': mode,
+        'total_seconds': round(total, 4),
+        'sequences_per_second': round(scored / total, 2) if total else 0.0,
+        'stages': {stage: round(seconds, 4) for stage, seconds in run_stats['stages'].items()},
+        'counts': run_stats['counts'],
+        'inference': run_stats['inference'],
+    }
+    waits = sorted(run_stats['queue_wait'])
+    if waits:
+        record['queue_wait'] = {
+            'p50': round(waits[len(waits) // 2], 3),
+            'p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3),
+            'max': round(waits[-1], 3),
+        }
+    try:
+        with open(ARGS.timing_log, 'a') as log:
+            log.write(json.dumps(record) + '\n')
+    except OSError as e:
+        print(f"Could not write timing log: {e}")
+    print("Stage timings: " + ', '.join(f"{k} {v:.2f}s" for k, v in record['stages'].items()))
+    run_stats['stages'], run_stats['counts'], run_stats['inference'], run_stats['queue_wait'] = {}, {}, {}, []
+
 
+def fetch_pending(config, limit=None):
+    """Return (id, sequence, submit_date) for pending submissions, oldest first"""
+    conn = connect(config)
     try:
-        conn = mysql.connector.connect(**config)
         cursor = conn.cursor()
-        
-        # Query to get pending sequences
         query = """
-        SELECT id, sequence 
-        FROM sequence_analyzer_sequencesubmission 
+        SELECT id, sequence, submit_date
+        FROM sequence_analyzer_sequencesubmission
         WHERE status = 'pending'
+        ORDER BY submit_date, id
         """
-        
+        if limit:
+            query += f" LIMIT {int(limit)}"
         cursor.execute(query)
-        results = cursor.fetchall()
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def bump_submissions_version(cursor, where, params):
+    """Invalidate the cached submissions pages of the owners of the submissions matching `where`.
+
+    Run it in the transaction that changes those submissions, so a page cached in between
+    never outlives the change."""
+    cursor.execute(f"""
+    UPDATE sequence_analyzer_userprofile
+    SET submissions_version = submissions_version + 1
+    WHERE user_id IN (SELECT DISTINCT user_id FROM sequence_analyzer_sequencesubmission WHERE {where})
+    """, params)
+
+
+def reclaim_expired(config):
+    """Return submissions whose worker stopped renewing its lease to the pending queue"""
+    conn = connect(config)
+    try:
+        cursor = conn.cursor()
+        now = utcnow()
+        bump_submissions_version(cursor, "status = 'processing' AND lease_expires < %s", [now])
+        cursor.execute("""
+        UPDATE sequence_analyzer_sequencesubmission
+        SET status = 'pending', worker_id = '', lease_expires = NULL
+        WHERE status = 'processing' AND lease_expires < %s
+        """, [now])
+        conn.commit()
+        if cursor.rowcount:
+            print(f"Reclaimed {cursor.rowcount} submissions with an expired lease")
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+# Sort key of each --scheduler over candidate rows (id, sequence, submit_date, priority, turn).
+# Whatever the scheduler, a claim takes this worker's own leftovers first, then higher
+# priorities, then submissions past --max_queue_wait.
+SCHEDULERS = {
+    # Oldest submission first
+    'fifo': lambda row: (row[2], row[0]),
+    # Each user's oldest submission in turn, so one bulk upload cannot hold everyone else back
+    'round_robin': lambda row: (row[4], row[2], row[0]),
+    # Shortest sequences first, so a --token_budget holds as many submissions as possible
+    'shortest_first': lambda row: (len(row[1]), row[2], row[0]),
+}
+# fifo and shortest_first pick from the CLAIM_WINDOW * limit highest-priority, oldest pending
+# submissions, read in submission_queue_idx order
+CLAIM_WINDOW = 4
+
+
+def pack(rows, token_budget):
+    """Keep the leading rows whose sequences (plus cls/eos tokens) fit in token_budget; at least one"""
+    if not token_budget:
+        return rows
+    packed, tokens = [], 0
+    for row in rows:
+        cost = len(row[1]) + 2
+        if packed and tokens + cost > token_budget:
+            break
+        packed.append(row)
+        tokens += cost
+    return packed
+
+
+def report_queue_wait(rows, claimed_at):
+    waits = sorted((claimed_at - row[2]).total_seconds() for row in rows)
+    run_stats['queue_wait'].extend(waits)
+    print(f"Claimed {len(rows)} submissions ({ARGS.scheduler}), queue wait p50 "
+          f"{waits[len(waits) // 2]:.1f}s, max {waits[-1]:.1f}s")
+
+
+def pending_candidates(cursor, limit):
+    """Read (id, sequence, submit_date, priority, turn) of pending submissions a claim may take.
+
+    A plain read: nothing is locked, so concurrent claimers never wait for each other here."""
+    if ARGS.scheduler == 'round_robin':
+        # turn = position of the submission in its owner's queue, walked along submission_user_queue_idx
+        cursor.execute(f"""
+        SELECT s.id, s.sequence, s.submit_date, s.priority, q.turn
+        FROM sequence_analyzer_sequencesubmission s JOIN (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY priority DESC, submit_date, id) AS turn
+            FROM sequence_analyzer_sequencesubmission
+            WHERE status = 'pending'
+        ) q ON q.id = s.id
+        WHERE q.turn <= {int(limit)}
+        """)
+    else:
+        window = limit if ARGS.scheduler == 'fifo' else limit * CLAIM_WINDOW
+        cursor.execute(f"""
+        SELECT id, sequence, submit_date, priority, 0
+        FROM sequence_analyzer_sequencesubmission
+        WHERE status = 'pending'
+        ORDER BY priority DESC, submit_date, id
+        LIMIT {int(window)}
+        """)
+    return cursor.fetchall()
+
+
+def claim_pending(config, limit):
+    """Lease up to `limit` submissions to this worker and return their (id, sequence, submit_date).
+
+    Submissions this worker already holds (left over from a run that was killed) come back
+    first, then pending ones in --scheduler order, cut to --token_budget. Candidates are read
+    without locks and claimed with one UPDATE that only takes rows still pending, so each row
+    goes to exactly one worker and only the claimed rows are ever locked. If other workers
+    took every candidate first, the claim is retried with fresh candidates until it gets
+    some or nothing is pending."""
+    reclaim_expired(config)
+    conn = connect(config)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT id, sequence, submit_date
+        FROM sequence_analyzer_sequencesubmission
+        WHERE status = 'processing' AND worker_id = %s
+        ORDER BY submit_date, id
+        """, [ARGS.worker_id])
+        leftovers = pack(cursor.fetchall()[:limit], ARGS.token_budget)
+        conn.commit()
+        rows = list(leftovers)
+        while len(leftovers) < limit:
+            candidates = pending_candidates(cursor, limit - len(leftovers))
+            conn.commit()
+            if not candidates:
+                break
+            now = utcnow()
+            overdue = now - timedelta(seconds=ARGS.max_queue_wait)
+            candidates.sort(key=lambda row: (-row[3], row[2] >= overdue, SCHEDULERS[ARGS.scheduler](row)))
+            chosen = pack(leftovers + [row[:3] for row in candidates], ARGS.token_budget)[len(leftovers):limit]
+            if not chosen:
+                break
+            ids = [row[0] for row in chosen]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"""
+            UPDATE sequence_analyzer_sequencesubmission
+            SET status = 'processing', worker_id = %s, lease_expires = %s, claim_date = COALESCE(claim_date, %s)
+            WHERE id IN ({placeholders}) AND status = 'pending'
+            """, [ARGS.worker_id, now + timedelta(seconds=ARGS.lease_seconds), now] + ids)
+            updated = cursor.rowcount
+            if updated:
+                claimed = f"id IN ({placeholders}) AND status = 'processing' AND worker_id = %s"
+                bump_submissions_version(cursor, claimed, ids + [ARGS.worker_id])
+                conn.commit()
+                cursor.execute(f"SELECT id FROM sequence_analyzer_sequencesubmission WHERE {claimed}",
+                               ids + [ARGS.worker_id])
+                won = {row[0] for row in cursor.fetchall()}
+                conn.commit()
+                rows += [row for row in chosen if row[0] in won]
+                break
+            conn.commit()
+            # Every candidate went to another worker in the meantime
+            time.sleep(random.uniform(0.01, 0.1))
+        if rows:
+            report_queue_wait(rows, utcnow())
+        return rows
+    except DB_ERRORS:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def extend_lease(config):
+    """Push back the lease expiry of every submission this worker holds"""
+    conn = connect(config)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+        UPDATE sequence_analyzer_sequencesubmission
+        SET lease_expires = %s
+        WHERE status = 'processing' AND worker_id = %s
+        """, [utcnow() + timedelta(seconds=ARGS.lease_seconds), ARGS.worker_id])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def release(config):
+    """Return the submissions this worker still holds (the ones it could not score) to the queue"""
+    conn = connect(config)
+    try:
+        cursor = conn.cursor()
+        bump_submissions_version(cursor, "status = 'processing' AND worker_id = %s", [ARGS.worker_id])
+        cursor.execute("""
+        UPDATE sequence_analyzer_sequencesubmission
+        SET status = 'pending', worker_id = '', lease_expires = NULL
+        WHERE status = 'processing' AND worker_id = %s
+        """, [ARGS.worker_id])
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+class LeaseHeartbeat:
+    """Renew this worker's leases from a background thread while the block runs and keeps progressing.
+
+    Call progress() whenever submissions are claimed or stored. If nothing progresses for
+    --max_claim_seconds (a hung server or subprocess), the leases are left to expire so
+    other workers can take the submissions; renewal resumes if progress does."""
+
+    def __init__(self, config):
+        self.config = config
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.progressed_at = time.monotonic()
+
+    def progress(self):
+        self.progressed_at = time.monotonic()
+
+    def run(self):
+        stalled = False
+        while not self.stopped.wait(ARGS.lease_seconds / 3):
+            idle = time.monotonic() - self.progressed_at
+            if idle > ARGS.max_claim_seconds:
+                if not stalled:
+                    print(f"No progress for {idle:.0f}s, no longer renewing leases")
+                stalled = True
+                continue
+            stalled = False
+            try:
+                extend_lease(self.config)
+            except DB_ERRORS as err:
+                print(f"Could not renew leases: {err}")
+
+    def __enter__(self):
+        self.progress()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def generate_aspred_input(config):
+
+    try:
+        with timed('db_read'):
+            results = claim_pending(config, ARGS.run_chunk_size)
         if not results:
             print("No new sequences to run the inference")
-            sys.exit(1)
+            return [], []
         id_lst = [row[0] for row in results]
+        seq_lst = [row[1] for row in results]
         
-        with open(predfile, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['sequence','_'])
-            for _, sequence in results:
-                writer.writerow([sequence, 0])
-        
-        print(f"Created {predfile} with {len(results)} sequences")
         print(f"ID list contains {len(id_lst)} IDs")
         
-        return id_lst
+        return id_lst, seq_lst
         
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Database error: {err}")
         print("Exiting due to an error")
         sys.exit(1)
+
+
+def write_aspred_input(sequences, keys=None):
+    """Write the input CSV; with keys, an id column lets read_output match rows to sequences"""
+    with timed('csv_write'), open(predfile, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        if keys is None:
+            writer.writerow(['sequence','_'])
+            for sequence in sequences:
+                writer.writerow([sequence, 0])
+        else:
+            writer.writerow(['id', 'sequence', '_'])
+            for key, sequence in zip(keys, sequences):
+                writer.writerow([key, sequence, 0])
+    print(f"Created {predfile} with {len(sequences)} sequences")
+
+
+def run_prediction():
+    print("Running prediction script...")
+    # A predictions file left by an earlier run must not be mistaken for this run's output
+    if os.path.exists(predictedfile):
+        os.remove(predictedfile)
+    with timed('subprocess'):
+        # --chunksize makes run_new_set.py append rows every --subprocess_chunk_size sequences,
+        # so a crash part way through a run chunk keeps the rows finished before it
+        subprocess.run(['uv', 'run', 'python', os.path.join(INFPATH, 'run_new_set.py'),
+                       '--model_path', *MODELPATHS,
+                       '--input_csv', os.path.join(curdir, predfile),
+                       '--precision', PRECISION,
+                       '--chunksize', str(ARGS.subprocess_chunk_size)],
+                       cwd=INFPATH)
+
+
+def server_mismatch(health):
+    """Return why the server described by its /health payload cannot score for this wrapper, or None"""
+    if health.get('precision') != PRECISION:
+        return f"it runs {health.get('precision')}, not {PRECISION}"
+    served = [os.path.realpath(path) for path in health.get('model_paths') or []]
+    wanted = [os.path.realpath(path) for path in MODELPATHS]
+    # The top-level scores are the server's first model, so that one must match --modelpath
+    if not served or served[0] != wanted[0] or not set(wanted) <= set(served):
+        return f"it serves {served or health.get('model_path')}, not {wanted}"
+    return None
+
+
+def run_prediction_server(sequences):
+    """Send sequences to the inference server, return None if it is not running or serves another
+    model, adapters or precision than this wrapper is configured for"""
+    base = SERVER_URL.rstrip('/')
+    request = urllib.request.Request(
+        base + '/predict',
+        data=json.dumps({'sequences': sequences, 'threshold': threshold}).encode(),
+        headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(base + '/health', timeout=10) as response:
+            reason = server_mismatch(json.load(response))
+        if reason:
+            print(f"Inference server at {SERVER_URL} does not match this wrapper ({reason}), "
+                  f"falling back to subprocess")
+            return None
+        with timed('inference_server'), urllib.request.urlopen(request, timeout=ARGS.server_timeout) as response:
+            payload = json.load(response)
+        run_stats['inference'] = payload.get('timings', {})
+    except (urllib.error.URLError, ConnectionError, TimeoutError, socket.timeout) as e:
+        print(f"Inference server not available at {SERVER_URL} ({e}), falling back to subprocess")
+        return None
+    except (ValueError, AttributeError) as e:
+        # Not JSON, or JSON that is not an object
+        print(f"Inference server at {SERVER_URL} sent a malformed response ({e}), falling back to subprocess")
+        return None
+    try:
+        if len(ADAPTERS) == 1:
+            predictions = {ADAPTERS[0]: payload['prob_class1']}
+        else:
+            served = payload.get('adapters') or {}
+            if not all(name in served for name in ADAPTERS):
+                print(f"Inference server does not serve all of {ADAPTERS}, falling back to subprocess")
+                return None
+            predictions = {name: served[name]['prob_class1'] for name in ADAPTERS}
+    except (KeyError, TypeError, AttributeError) as e:
+        print(f"Inference server response lacks predictions ({e!r}), falling back to subprocess")
+        return None
+    print(f"Got {len(sequences)} predictions from inference server")
+    return predictions
+
+
+# (run_new_set module, model, tokenizer), loaded on first use by run_prediction_inprocess
+_inprocess_model = None
+
+
+def run_prediction_inprocess(sequences):
+    """Score sequences in this process; torch and transformers are only imported here"""
+    global _inprocess_model
+    if _inprocess_model is None:
+        sys.path.insert(0, INFPATH)
+        import run_new_set
+        if len(MODELPATHS) > 1:
+            model, tokenizer, _ = run_new_set.load_adapters(MODELPATHS, precision=PRECISION)
+        else:
+            model, tokenizer = run_new_set.load_model(MODELPATHS[0], precision=PRECISION)
+        _inprocess_model = (run_new_set, model, tokenizer)
+    run_new_set, model, tokenizer = _inprocess_model
+
+    timings = run_new_set.new_timings()
+    with timed('inference_inprocess'):
+        if len(MODELPATHS) > 1:
+            results = run_new_set.predict_adapters(model, tokenizer, ADAPTERS, sequences, threshold,
+                                                   precision=PRECISION, timings=timings)
+        else:
+            results = {ADAPTERS[0]: run_new_set.predict(model, tokenizer, sequences, threshold,
+                                                        precision=PRECISION, timings=timings)}
+    timings['batches'] = len(timings['batches'])
+    run_stats['inference'] = timings
+    print(f"Scored {len(sequences)} sequences in process")
+
+    if ARGS.debug_csv:
+        write_aspred_input(sequences)
+        with open(predictedfile, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            columns = [f'{column}_{name}' for name in ADAPTERS for column in ('prob', 'predicted_label')]
+            writer.writerow(['sequence', 'prob_class1', 'predicted_label'] if len(ADAPTERS) == 1
+                            else ['sequence'] + columns)
+            values = [v for name in ADAPTERS for v in (results[name][1], results[name][2])]
+            writer.writerows(zip(sequences, *values))
+        print(f"Created {predictedfile} with {len(sequences)} predictions")
+    return {name: probs for name, (_, probs, _) in results.items()}
+
+
+def predict_sequences(sequences, keys):
+    """Get {adapter name: scores} for sequences in process, from the server, or the subprocess as a fallback
+
+    Scores line up with keys; the subprocess path returns None for sequences it did not finish."""
+    if ARGS.inprocess:
+        return run_prediction_inprocess(sequences)
+    predictions = run_prediction_server(sequences)
+    if predictions is None:
+        write_aspred_input(sequences, keys)
+        run_prediction()
+        #run_prediction_test()
+        predictions = read_output(keys)
+    return predictions
+
+
+def normalize_sequence(sequence):
+    """The ESM vocabulary is upper case, so sequences are scored and cached upper-cased"""
+    return sequence.strip().upper()
+
+
+def sequence_hash(sequence):
+    return hashlib.sha256(sequence.encode()).hexdigest()
+
+
+# path -> ((size, mtime_ns), sha256 of the contents), so unchanged files are hashed once per process
+_file_digests = {}
+
+
+def file_sha256(path):
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    if _file_digests.get(path, (None,))[0] != key:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[path] = (key, digest.hexdigest())
+    return _file_digests[path][1]
+
+
+def model_version(model_dir):
+    """Fingerprint the model file contents and precision, so a changed model gets its own cache entries.
+
+    The fingerprint only depends on file contents, so every host and every copy of the same
+    model agrees on it. Adapters of a prepare_model.py snapshot use the checksums in its
+    manifest (base model and adapter) instead of reading the files."""
+    digest = hashlib.sha256(PRECISION.encode())
+    snapshot = os.path.dirname(os.path.dirname(os.path.normpath(model_dir)))
+    manifest = os.path.join(snapshot, 'snapshot.json')
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            files = json.load(f)['files']
+        adapter = os.path.relpath(model_dir, snapshot)
+        for relpath in sorted(files):
+            if relpath.startswith('base' + os.sep) or relpath.startswith(adapter + os.sep):
+                digest.update(f"{relpath}:{files[relpath]}".encode())
+        return digest.hexdigest()
+    for root, dirs, files in os.walk(model_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(('.json', '.safetensors', '.bin', '.onnx', '.onnx.data', '.pt')):
+                continue
+            path = os.path.join(root, name)
+            digest.update(f"{os.path.relpath(path, model_dir)}:{file_sha256(path)}".encode())
+    return digest.hexdigest()
+
+
+# time.monotonic() of the last expire_cache run in this process
+_cache_expired_at = None
+
+
+def expire_cache(versions, config):
+    """Delete cached predictions of model versions other than `versions` that have not been used for
+    --cache_max_age_days (or all of them with --invalidate_cache).
+
+    Other workers may still be running another version, so their entries are only dropped
+    once nobody has read them for a while. Runs at most once an hour per process."""
+    global _cache_expired_at
+    if _cache_expired_at is not None and time.monotonic() - _cache_expired_at < 3600:
+        return
+    _cache_expired_at = time.monotonic()
+    try:
+        conn = connect(config)
+        cursor = conn.cursor()
+        placeholders = ', '.join(['%s'] * len(versions))
+        query = f"DELETE FROM sequence_analyzer_predictioncache WHERE model_version NOT IN ({placeholders})"
+        params = list(versions)
+        if not ARGS.invalidate_cache:
+            query += " AND COALESCE(last_hit, created) < %s"
+            params.append(utcnow() - timedelta(days=ARGS.cache_max_age_days))
+        cursor.execute(query, params)
+        if cursor.rowcount:
+            print(f"Expired {cursor.rowcount} cached predictions from other model versions")
+        conn.commit()
+    except DB_ERRORS as err:
+        print(f"Database error while expiring prediction cache: {err}")
     finally:
         if 'conn' in locals():
             conn.close()
 
 
+def lookup_cache(hashes, version, config, chunk_size=1000):
+    """Return {sequence_hash: result} for cached predictions of the given model version"""
+    cached = {}
+    try:
+        conn = connect(config)
+        cursor = conn.cursor()
+        now = utcnow()
+        for start in range(0, len(hashes), chunk_size):
+            chunk = hashes[start:start + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            params = (version, threshold, *chunk)
+            cursor.execute(f"""
+            SELECT sequence_hash, result
+            FROM sequence_analyzer_predictioncache
+            WHERE model_version = %s AND threshold = %s AND sequence_hash IN ({placeholders})
+            """, params)
+            cached.update(cursor.fetchall())
+            cursor.execute(f"""
+            UPDATE sequence_analyzer_predictioncache
+            SET hits = hits + 1, last_hit = %s
+            WHERE model_version = %s AND threshold = %s AND sequence_hash IN ({placeholders})
+            """, (now, *params))
+        conn.commit()
+    except DB_ERRORS as err:
+        print(f"Database error while reading prediction cache: {err}")
+    finally:
+        if 'conn' in locals():
+            conn.close()
+    return cached
 
-def run_prediction():
-    print("Running prediction script...")
-    subprocess.run(['uv', 'run', 'python', os.path.join(INFPATH, 'run_new_set.py'), 
-                    '--model_path', MODELPATH, 
-                    '--input_csv', os.path.join(curdir, predfile)],
-                    cwd=INFPATH)
+
+def store_cache(results, version, config):
+    """Save {sequence_hash: result} for the current model version"""
+    try:
+        conn = connect(config)
+        cursor = conn.cursor()
+        now = utcnow()
+        cursor.executemany("""
+        INSERT INTO sequence_analyzer_predictioncache
+            (sequence_hash, model_version, threshold, result, hits, created)
+        VALUES (%s, %s, %s, %s, 0, %s)
+        """ + ("ON CONFLICT (model_version, threshold, sequence_hash) DO UPDATE SET result = excluded.result"
+               if ARGS.sqlite else "ON DUPLICATE KEY UPDATE result = VALUES(result)"), [(h, version, threshold, float(r), now) for h, r in results.items()])
+        conn.commit()
+    except DB_ERRORS as err:
+        print(f"Database error while writing prediction cache: {err}")
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+
+def cached_predictions(seq_lst, config):
+    """Score seq_lst, running the model only on sequences that are neither cached nor duplicates.
+
+    Returns one {adapter name: score} dict per sequence; each adapter is cached under its own
+    model version."""
+    versions = {name: model_version(path) for name, path in zip(ADAPTERS, MODELPATHS)}
+    hashes = [sequence_hash(normalize_sequence(s)) for s in seq_lst]
+    unique = dict(zip(hashes, (normalize_sequence(s) for s in seq_lst)))
+    with timed('cache_lookup'):
+        expire_cache(list(versions.values()), config)
+        results = {name: lookup_cache(list(unique), version, config) for name, version in versions.items()}
+
+    # A sequence is rescored for every adapter if any adapter is missing it
+    missing = [h for h in unique if not all(h in results[name] for name in ADAPTERS)]
+    hit_rate = (len(seq_lst) - len(missing)) / len(seq_lst)
+    print(f"Prediction cache: {len(unique) - len(missing)} of {len(unique)} unique sequences cached, "
+          f"{len(missing)} to score ({hit_rate:.0%} of {len(seq_lst)} submissions served without inference)")
+    count('sequences', len(seq_lst))
+    count('unique_sequences', len(unique))
+    count('cache_hits', len(unique) - len(missing))
+    count('scored', len(missing))
+
+    if missing:
+        predictions = predict_sequences([unique[h] for h in missing], missing)
+        if any(len(predictions.get(name, [])) != len(missing) for name in ADAPTERS):
+            print(f"Expected {len(missing)} predictions for each of {ADAPTERS}; leaving them pending")
+            predictions = {name: [None] * len(missing) for name in ADAPTERS}
+        for name in ADAPTERS:
+            # Partial output is still cached, so a rerun only scores what is left
+            new_results = {h: p for h, p in zip(missing, predictions[name]) if p is not None}
+            with timed('cache_store'):
+                store_cache(new_results, versions[name], config)
+            results[name].update(new_results)
+    # None for sequences that could not be scored
+    return [{name: float(results[name][h]) for name in ADAPTERS}
+            if all(h in results[name] for name in ADAPTERS) else None
+            for h in hashes]
 
 
 def run_prediction_test():
@@ -114,7 +935,7 @@ def run_prediction_test():
             sequences = list(reader)
         with open(predictedfile, 'w', newline='') as outfile:
             writer = csv.writer(outfile)
-            writer.writerow(['sequence', 'label', 'predicted_probs', 'predicted_labels'])
+            writer.writerow(['sequence', 'label', 'prob_class1', 'predicted_label'])
             for sequence, label in sequences:
                 prob = random.random()
                 pred_label = 1 if prob >= 0.5 else 0
@@ -126,58 +947,275 @@ def run_prediction_test():
         print(f"Error creating predictions file: {e}")
 
 
-def read_output():
-    """Read the third column from the predictions CSV file"""
-    predictions = []
+def read_output(keys=None):
+    """Read {adapter name: scores} from the predictions CSV file
+
+    The file has a prob_class1 column for a single model and prob_<name> per adapter otherwise.
+    With keys, rows are matched on the id column and keys without a row get None, so
+    output cut short by a crash still lines up."""
+    columns = {ADAPTERS[0]: 'prob_class1'} if len(ADAPTERS) == 1 else {name: f'prob_{name}' for name in ADAPTERS}
+    predictions = {name: [] for name in ADAPTERS}
     try:
-        with open(predictedfile, 'r', newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            next(reader)
-            for row in reader:
-                if len(row) >= 3:
-                    predictions.append(row[3]) 
+        with timed('parse'), open(predictedfile, 'r', newline='') as csvfile:
+            reader = csv.DictReader(csvfile)
+            if keys is None:
+                for row in reader:
+                    for name, column in columns.items():
+                        predictions[name].append(row[column])
+                return predictions
+            rows = {row['id']: row for row in reader}
+        for name, column in columns.items():
+            predictions[name] = [rows[key][column] if key in rows else None for key in keys]
+        if len(rows) < len(keys):
+            print(f"Predictions file has {len(rows)} of {len(keys)} rows, the rest stay pending")
         return predictions
     except FileNotFoundError:
         print(f"Error: {predictedfile} not found 105")
-        return []
+        return {}
     except Exception as e:
         print(f"Error reading predictions file: {e}")
-        return []
+        return {}
 
 
-def update_database(id_lst, predictions, config):
-    """Update the database with prediction results"""
+def update_database(id_lst, predictions, config, chunk_size=None):
+    """Update the database with prediction results ({adapter name: score} per submission).
 
+    The primary adapter's score goes into result and all scores into adapter_results.
+    Rows are written with one UPDATE ... CASE statement per chunk, and each chunk is
+    committed on its own so row locks are only held for a single chunk. Returns the
+    number of rows committed."""
+    if len(id_lst) != len(predictions):
+        print(f"Got {len(predictions)} predictions for {len(id_lst)} submissions; not updating")
+        return 0
+    chunk_size = chunk_size or ARGS.write_chunk_size
+    rows = [(id_val, float(prediction[ADAPTERS[0]]), json.dumps(prediction))
+            for id_val, prediction in zip(id_lst, predictions) if prediction is not None]
+    if not rows:
+        return 0
+    updated = 0
+    start = time.perf_counter()
     try:
-        conn = mysql.connector.connect(**config)
+        conn = connect(config)
         cursor = conn.cursor()
-        now = datetime.now()
-        for id_val, prediction in zip(id_lst, predictions):
-            result = float(prediction)
-            query = """
+        now = utcnow()
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+            placeholders = ', '.join(['%s'] * len(chunk))
+            query = f"""
             UPDATE sequence_analyzer_sequencesubmission
-            SET result = %s, result_date = %s, status = 'done'
-            WHERE id = %s
+            SET result = CASE id {cases} END, adapter_results = CASE id {cases} END,
+                result_date = %s, status = 'done', worker_id = '', lease_expires = NULL
+            WHERE id IN ({placeholders}) AND status = 'processing' AND worker_id = %s
             """
-            cursor.execute(query, (result, now, id_val))
-        conn.commit()
-        print(f"Updated {len(id_lst)} rows in the database")
+            ids = [id_val for id_val, _, _ in chunk]
+            params = ([v for id_val, result, _ in chunk for v in (id_val, result)] +
+                      [v for id_val, _, adapter_results in chunk for v in (id_val, adapter_results)] +
+                      [now] + ids + [ARGS.worker_id])
+            cursor.execute(query, params)
+            written = cursor.rowcount
+            if written < len(chunk):
+                # The lease ran out and the submission was handed to another worker
+                print(f"{len(chunk) - written} submissions in this chunk are no longer leased to "
+                      f"{ARGS.worker_id}; their results were dropped")
+            bump_submissions_version(cursor, f"id IN ({placeholders})", ids)
+            conn.commit()
+            updated += written
+        elapsed = time.perf_counter() - start
+        print(f"Updated {updated} rows in the database in {elapsed:.2f}s "
+              f"({updated / elapsed if elapsed else 0:.0f} rows/s)")
 
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Database error: {err}")
+        print(f"{updated} of {len(rows)} rows were committed before the error")
         if 'conn' in locals():
             conn.rollback()
     finally:
         if 'conn' in locals():
             conn.close()
+        run_stats['stages']['db_update'] = run_stats['stages'].get('db_update', 0.0) + time.perf_counter() - start
+        count('rows_updated', updated)
+    return updated
+
+
+def load_journal():
+    """Return {submission id: prediction} saved in the run journal by an interrupted run"""
+    results = {}
+    if not os.path.exists(ARGS.journal):
+        return results
+    with open(ARGS.journal) as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line may have been cut off by the crash
+                continue
+            results.update({int(id_val): prediction for id_val, prediction in entry['results'].items()})
+    return results
+
+
+def append_journal(chunk, results):
+    """Durably record a finished chunk's {submission id: prediction} before it is written to the database"""
+    with open(ARGS.journal, 'a') as journal:
+        journal.write(json.dumps({
+            'chunk': chunk,
+            'finished': datetime.now(timezone.utc).isoformat(),
+            'results': {str(id_val): prediction for id_val, prediction in results.items()},
+        }) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+
+def run_checkpointed(id_lst, seq_lst, config, heartbeat=None):
+    """Score and store submissions --run_chunk_size at a time.
+
+    Each chunk is journaled by submission id and written to the database as soon as it is
+    scored, so an interrupted run loses at most the chunk in progress: completed chunks
+    are no longer pending, and journaled results whose database write did not happen are
+    written at the start of the next run without scoring them again. The journal is
+    removed once every scored result has been written. Every stored chunk counts as progress
+    for `heartbeat`. Returns the number of rows written."""
+    journal = load_journal()
+    recovered = {id_val: journal[id_val] for id_val in id_lst if id_val in journal}
+    written = True
+    total = 0
+    if recovered:
+        print(f"Resuming: writing {len(recovered)} results saved in {ARGS.journal} by an interrupted run")
+        total = update_database(list(recovered), list(recovered.values()), config)
+        written = total == len(recovered)
+
+    todo = [(id_val, seq) for id_val, seq in zip(id_lst, seq_lst) if id_val not in recovered]
+    chunk_size = ARGS.run_chunk_size
+    chunks = (len(todo) + chunk_size - 1) // chunk_size
+    unscored = 0
+    for n, start in enumerate(range(0, len(todo), chunk_size)):
+        chunk = todo[start:start + chunk_size]
+        predictions = cached_predictions([seq for _, seq in chunk], config)
+        done = {id_val: prediction for (id_val, _), prediction in zip(chunk, predictions) if prediction is not None}
+        unscored += len(chunk) - len(done)
+        append_journal(n, done)
+        updated = update_database(list(done), list(done.values()), config)
+        total += updated
+        written = updated == len(done) and written
+        if heartbeat and updated:
+            heartbeat.progress()
+        print(f"Chunk {n + 1}/{chunks}: {len(done)} of {len(chunk)} submissions scored")
+
+    if unscored:
+        print(f"{unscored} submissions could not be scored and stay pending")
+    if written and os.path.exists(ARGS.journal):
+        os.remove(ARGS.journal)
+    return total
+
+
+# Longest wait between retries of a watch batch that keeps failing
+MAX_BACKOFF_SECONDS = 300
+
+# Defaults for --profile: latency flushes small batches quickly, throughput waits for full ones
+BATCH_PROFILES = {
+    'latency': {'max_batch': 16, 'max_wait_ms': 500, 'poll_interval': 1.0},
+    'throughput': {'max_batch': 512, 'max_wait_ms': 30000, 'poll_interval': 5.0},
+}
+
+
+def watch(config):
+    """Poll for pending submissions until SIGTERM/SIGINT, flushing a batch once it holds
+    max_batch sequences or its oldest submission has waited max_wait_ms"""
+    profile = BATCH_PROFILES[ARGS.profile]
+    max_batch = ARGS.max_batch or profile['max_batch']
+    max_wait_ms = ARGS.max_wait_ms if ARGS.max_wait_ms is not None else profile['max_wait_ms']
+    poll_interval = ARGS.poll_interval or profile['poll_interval']
+    print(f"Watching for pending submissions ({ARGS.profile} profile: max_batch={max_batch}, "
+          f"max_wait_ms={max_wait_ms}, poll_interval={poll_interval}s)")
+
+    stopping = []
+
+    def request_stop(signum, frame):
+        print(f"Received signal {signum}, stopping after the current batch")
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # Flushes in a row that stored nothing; each one doubles the wait before the next attempt
+    failures = 0
+    while not stopping:
+        try:
+            reclaim_expired(config)
+            pending = fetch_pending(config, limit=max_batch)
+        except DB_ERRORS as err:
+            print(f"Database error: {err}")
+            pending = []
+
+        if pending:
+            # Django stores submit_date as naive UTC
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            waited_ms = (now - pending[0][2]).total_seconds() * 1000
+            if len(pending) >= max_batch or waited_ms >= max_wait_ms:
+                started = time.perf_counter()
+                try:
+                    claimed = claim_pending(config, max_batch)
+                except DB_ERRORS as err:
+                    print(f"Database error: {err}")
+                    claimed = None
+                written = 0
+                if claimed:
+                    id_lst = [row[0] for row in claimed]
+                    seq_lst = [row[1] for row in claimed]
+                    print(f"Flushing batch of {len(id_lst)} sequences (oldest waited {waited_ms:.0f} ms)")
+                    with LeaseHeartbeat(config) as heartbeat:
+                        try:
+                            written = run_checkpointed(id_lst, seq_lst, config, heartbeat)
+                        finally:
+                            release(config)
+                    write_timing_log(started, 'watch')
+                if written:
+                    failures = 0
+                    continue
+                if claimed == []:
+                    # Other workers claimed all of the peeked submissions
+                    delay = poll_interval
+                else:
+                    # Nothing was stored (prediction or database failure): back off instead of
+                    # relaunching the same batch in a tight loop
+                    failures += 1
+                    delay = min(poll_interval * 2 ** (failures - 1), MAX_BACKOFF_SECONDS)
+                    print(f"Batch failed {failures} time(s) in a row, retrying in {delay:.1f}s")
+            else:
+                # Sleep only until the oldest pending submission is due
+                delay = min(poll_interval, (max_wait_ms - waited_ms) / 1000)
+        else:
+            delay = poll_interval
+
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(0.1, delay))
+    print("Stopped")
 
 
 if __name__ == "__main__":
-    id_lst = generate_aspred_input(db_config)
-    print("ID list:", id_lst)
-    run_prediction()
-    #run_prediction_test()
-    preds_lst = read_output()
-    print(preds_lst)
-    update_database(id_lst, preds_lst, db_config)
+    if ARGS.watch:
+        watch(db_config)
+        sys.exit(0)
+    started = time.perf_counter()
+    claimed = 0
+    # Claim --run_chunk_size submissions at a time so other workers can take the rest
+    with LeaseHeartbeat(db_config) as heartbeat:
+        while True:
+            id_lst, seq_lst = generate_aspred_input(db_config)
+            if not id_lst:
+                break
+            heartbeat.progress()
+            claimed += len(id_lst)
+            print("ID list:", id_lst)
+            try:
+                written = run_checkpointed(id_lst, seq_lst, db_config, heartbeat)
+            finally:
+                release(db_config)
+            if not written:
+                print("Nothing from this batch could be stored, stopping")
+                break
+    if not claimed:
+        sys.exit(1)
+    write_timing_log(started, 'oneshot')
 